@@ -0,0 +1,578 @@
+"""
+Benchmarks for the sync and command round-trip paths.
+
+Every scenario runs in a fresh interpreter against a local MockServer, so
+cold-start numbers and peak RSS are measured per scenario. Results are written
+as JSON; `compare` diffs two result files and fails on regressions.
+
+    python -m agi_tools_client.bench run --output before.json
+    python -m agi_tools_client.bench compare before.json after.json
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import typer
+
+from agi_tools_client import __version__
+from agi_tools_client.mock_server import MockServer
+
+MB = 1024 * 1024
+BENCH_APIKEY = "bench"
+
+app = typer.Typer(help="Benchmarks for the AGI Tools client", no_args_is_help=True)
+
+
+# --- Synthetic workspaces (built in the parent process) ---
+
+
+def _write_file(path: Path, size: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 4 * MB)
+            f.write(os.urandom(chunk))
+            remaining -= chunk
+
+
+def _prepare_small_files(workspace: Path, volume: Path, quick: bool):
+    count = 1_000 if quick else 10_000
+    for i in range(count):
+        _write_file(workspace / f"dir{i % 100:03d}" / f"file{i:05d}.json", 1024)
+
+
+def _prepare_huge_files(workspace: Path, volume: Path, quick: bool):
+    size = 8 * MB if quick else 64 * MB
+    for i in range(3):
+        _write_file(workspace / f"huge{i}.bin", size)
+
+
+def _prepare_deep_tree(workspace: Path, volume: Path, quick: bool):
+    depth = 16 if quick else 64
+    current = workspace
+    for level in range(depth):
+        current = current / f"level{level:02d}"
+        for i in range(8):
+            _write_file(current / f"node{i}.yaml", 512)
+
+
+def _prepare_mixed_tree(workspace: Path, volume: Path, quick: bool):
+    # Old bulk data at the top level, which the workspace scan reaches first,
+    # and recently edited DAG files below it
+    size = 8 * MB if quick else 32 * MB
+    old = time.time() - 86400
+    for i in range(6):
+        _write_file(workspace / f"blob{i}.bin", size)
+        os.utime(workspace / f"blob{i}.bin", (old, old))
+    for i in range(300 if quick else 1_000):
+        _write_file(workspace / "dags" / f"dag{i:04d}.yaml", 2048)
+
+
+def _prepare_volume(size: int) -> Callable[[Path, Path, bool], None]:
+    def prepare(workspace: Path, volume: Path, quick: bool):
+        file_size = 256 * 1024
+        for i in range(max(1, size // file_size)):
+            _write_file(volume / "outputs" / f"artifact{i:04d}.bin", file_size)
+
+    return prepare
+
+
+def _prepare_formatted_output(workspace: Path, volume: Path, quick: bool):
+    # Rich-style console output: ANSI styles, box drawing and ragged spacing
+    row = (
+        "\x1b[1m│\x1b[0m node_{0:06d}   ─── \x1b[32mcompiled\x1b[0m"
+        "  output/dag_{0:06d}.json   ╭──╮\n   \n"
+    )
+    rows = 20_000 if quick else 100_000
+    (workspace / "output.txt").write_text(
+        "".join(row.format(i) for i in range(rows)), encoding="utf-8"
+    )
+
+
+def _prepare_sync_index(workspace: Path, volume: Path, quick: bool):
+    # A legacy JSON upload cache for a large workspace; no files are needed
+    count = 100_000 if quick else 1_000_000
+    cache = {
+        f"project{i % 97:02d}/module{i % 1009:04d}/file{i:07d}.yaml": {
+            "mtime": 1_700_000_000.0 + i / 7,
+            "size": i % 65536,
+        }
+        for i in range(count)
+    }
+    with open(workspace / "legacy_cache.json", "w") as f:
+        json.dump(cache, f, indent=2)
+
+
+def _prepare_large_prompt(workspace: Path, volume: Path, quick: bool):
+    # A text argument the client inlines into the request body
+    line = "step: build the dependency graph and compile every node\n"
+    size = 16 * MB if quick else 256 * MB
+    with open(workspace / "prompt.txt", "w") as f:
+        for _ in range(0, size, 4 * MB):
+            f.write(line * (4 * MB // len(line)))
+
+
+def _prepare_roundtrip(workspace: Path, volume: Path, quick: bool):
+    for i in range(10):
+        _write_file(workspace / f"dag{i}.yaml", 2048)
+
+
+# --- Measurements (run in the child process) ---
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _latency_metrics(samples_s: List[float]) -> Dict[str, float]:
+    samples_ms = [s * 1000 for s in samples_s]
+    return {
+        "p50_ms": statistics.median(samples_ms),
+        "p95_ms": _percentile(samples_ms, 0.95),
+    }
+
+
+def _peak_rss_mb() -> Optional[float]:
+    # getrusage() keeps the parent's high-water mark across exec on Linux, so
+    # prefer the per-process VmHWM when it is available.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+def _tree_stats(root: Path):
+    files = [p for p in root.rglob("*") if p.is_file() and not p.name.startswith(".")]
+    return len(files), sum(p.stat().st_size for p in files)
+
+
+def _import_cli():
+    start = time.perf_counter()
+    from agi_tools_client import cli
+
+    return cli, time.perf_counter() - start
+
+
+def _measure_startup_cold(api_url: str, repeat: int) -> Dict[str, Any]:
+    _, elapsed = _import_cli()
+    return {"samples_s": [elapsed]}
+
+
+def _measure_startup_warm(api_url: str, repeat: int) -> Dict[str, Any]:
+    cli, _ = _import_cli()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cli.create_cli_apps()
+        samples.append(time.perf_counter() - start)
+    return _latency_metrics(samples)
+
+
+def _measure_upstream(api_url: str, repeat: int) -> Dict[str, Any]:
+    cli, _ = _import_cli()
+    files, size = _tree_stats(Path.cwd())
+    metrics: Dict[str, Any] = {"files": files, "bytes": size}
+    for phase in ("cold", "warm"):
+        start = time.perf_counter()
+        cli._perform_upstream_sync(api_url, BENCH_APIKEY)
+        elapsed = time.perf_counter() - start
+        metrics[f"{phase}_wall_s"] = elapsed
+        metrics[f"{phase}_files_per_s"] = files / elapsed
+        if phase == "cold":
+            metrics["cold_mb_per_s"] = size / MB / elapsed
+    return metrics
+
+
+def _measure_upload_order(api_url: str, repeat: int) -> Dict[str, Any]:
+    # Upload spans tell when each file landed; hidden files are never synced
+    trace_file = Path.cwd() / ".bench-trace.jsonl"
+    os.environ["AGI_TRACE"] = str(trace_file)
+    cli, _ = _import_cli()
+    from agi_tools_client import tracing
+
+    start = time.perf_counter()
+    cli._perform_upstream_sync(api_url, BENCH_APIKEY)
+    elapsed = time.perf_counter() - start
+    tracing.flush()
+
+    spans = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    sync_start = min(s["start_ns"] for s in spans if s["name"] == "sync.upstream")
+    done: Dict[str, List[float]] = {"small": [], "large": []}
+    for s in spans:
+        if s["name"] == "upload":
+            lane = "large" if s["attributes"]["bytes"] > MB else "small"
+            done[lane].append((s["end_ns"] - sync_start) / 1e9)
+    return {
+        "wall_s": elapsed,
+        "small_files_p50_s": statistics.median(done["small"]),
+        "small_files_done_s": max(done["small"]),
+        "large_files_done_s": max(done["large"]),
+    }
+
+
+def _measure_downstream(mode: str) -> Callable[[str, int], Dict[str, Any]]:
+    def measure(api_url: str, repeat: int) -> Dict[str, Any]:
+        os.environ["AGI_DOWNLOAD_MODE"] = mode
+        cli, _ = _import_cli()
+        start = time.perf_counter()
+        cli._synchronize_user_directory(api_url, BENCH_APIKEY)
+        elapsed = time.perf_counter() - start
+        files, size = _tree_stats(Path.cwd())
+        return {
+            "files": files,
+            "bytes": size,
+            "wall_s": elapsed,
+            "files_per_s": files / elapsed,
+            "mb_per_s": size / MB / elapsed,
+        }
+
+    return measure
+
+
+def _measure_roundtrip(api_url: str, repeat: int) -> Dict[str, Any]:
+    cli, _ = _import_cli()
+    spec = cli.load_openapi_spec()
+    path_str = "/dagify/compose"
+    command = cli.create_command_function(
+        path_str, "post", spec["paths"][path_str]["post"], spec
+    )
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        command(prompt="benchmark")
+        samples.append(time.perf_counter() - start)
+    return _latency_metrics(samples)
+
+
+def _measure_debug_command(api_url: str, repeat: int) -> Dict[str, Any]:
+    # Debug logging must be on before the CLI configures logging at import
+    os.environ["DEBUG"] = "1"
+    cli, _ = _import_cli()
+    spec = cli.load_openapi_spec()
+    path_str = "/dagify/compose"
+    command = cli.create_command_function(
+        path_str, "post", spec["paths"][path_str]["post"], spec
+    )
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        command(prompt="prompt.txt", skip_pre_sync=True, skip_post_sync=True)
+        samples.append(time.perf_counter() - start)
+    return _latency_metrics(samples)
+
+
+def _measure_clean_text(api_url: str, repeat: int) -> Dict[str, Any]:
+    cli, _ = _import_cli()
+    text = Path("output.txt").read_text(encoding="utf-8")
+    size_mb = len(text.encode("utf-8")) / MB
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cli.clean_formatted_text(text)
+        samples.append(time.perf_counter() - start)
+    metrics: Dict[str, Any] = _latency_metrics(samples)
+    metrics["mb_per_s"] = size_mb / statistics.median(samples)
+
+    chunk = 64 * 1024
+    start = time.perf_counter()
+    for _ in cli.iter_clean_formatted_lines(
+        text[i : i + chunk] for i in range(0, len(text), chunk)
+    ):
+        pass
+    metrics["stream_mb_per_s"] = size_mb / (time.perf_counter() - start)
+    return metrics
+
+
+def _traced_mb(load: Callable[[], Any]) -> float:
+    """Python heap held by the object load() returns."""
+    import tracemalloc
+
+    tracemalloc.start()
+    obj = load()
+    size = tracemalloc.get_traced_memory()[0] / MB
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def _measure_sync_index(api_url: str, repeat: int) -> Dict[str, Any]:
+    from agi_tools_client.syncindex import SyncIndex
+
+    legacy, index_file = Path("legacy_cache.json"), Path(".sync_index")
+
+    def load_legacy() -> Dict[str, Any]:
+        with open(legacy) as f:
+            return json.load(f)
+
+    start = time.perf_counter()
+    mapping = load_legacy()
+    metrics: Dict[str, Any] = {
+        "entries": len(mapping),
+        "legacy_load_s": time.perf_counter() - start,
+    }
+    start = time.perf_counter()
+    index = SyncIndex.from_mapping(mapping)
+    metrics["migrate_s"] = time.perf_counter() - start
+    paths = list(mapping)[:: max(1, len(mapping) // 100_000)]
+    del mapping
+
+    start = time.perf_counter()
+    index.save(index_file)
+    metrics["save_s"] = time.perf_counter() - start
+    metrics["file_mb"] = index_file.stat().st_size / MB
+    metrics["legacy_file_mb"] = legacy.stat().st_size / MB
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index = SyncIndex.load(index_file)
+        samples.append(time.perf_counter() - start)
+    metrics.update(_latency_metrics(samples))
+
+    start = time.perf_counter()
+    for path in paths:
+        index.mark(path, 1.0, 1)
+    index.compact()
+    metrics["mark_per_s"] = len(paths) / (time.perf_counter() - start)
+    del index
+
+    metrics["legacy_heap_mb"] = _traced_mb(load_legacy)
+    metrics["index_heap_mb"] = _traced_mb(lambda: SyncIndex.load(index_file))
+    return metrics
+
+
+SCENARIOS = {
+    "startup_cold": (None, _measure_startup_cold),
+    "startup_warm": (None, _measure_startup_warm),
+    "upstream_small_files": (_prepare_small_files, _measure_upstream),
+    "upstream_huge_files": (_prepare_huge_files, _measure_upstream),
+    "upstream_deep_tree": (_prepare_deep_tree, _measure_upstream),
+    "upstream_priority_order": (_prepare_mixed_tree, _measure_upload_order),
+    "downstream_zip_8mb": (_prepare_volume(8 * MB), _measure_downstream("zip")),
+    "downstream_zip_64mb": (_prepare_volume(64 * MB), _measure_downstream("zip")),
+    "downstream_fanout_8mb": (
+        _prepare_volume(8 * MB),
+        _measure_downstream("fanout"),
+    ),
+    "downstream_fanout_64mb": (
+        _prepare_volume(64 * MB),
+        _measure_downstream("fanout"),
+    ),
+    "command_roundtrip": (_prepare_roundtrip, _measure_roundtrip),
+    "command_debug_large_prompt": (_prepare_large_prompt, _measure_debug_command),
+    "clean_text_large": (_prepare_formatted_output, _measure_clean_text),
+    "sync_index_1m": (_prepare_sync_index, _measure_sync_index),
+}
+
+
+def _run_child(
+    name: str, workspace: Path, api_url: str, repeat: int, result_file: Path
+) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "DOCKER_BUILDER_API_URL": api_url,
+            "AGINT_APIKEY": BENCH_APIKEY,
+            # Keep the shared upload store in the scenario's temp directory,
+            # away from the host's real one
+            "AGI_STORE_DIR": str(result_file.parent),
+            "PYTHONPATH": os.pathsep.join(
+                filter(None, [str(Path(__file__).parent.parent), env.get("PYTHONPATH")])
+            ),
+        }
+    )
+    env.pop("DEBUG", None)
+    env.pop("DOCKER_BUILDER_API_URLS", None)
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "agi_tools_client.bench",
+            "scenario",
+            name,
+            "--api-url",
+            api_url,
+            "--repeat",
+            str(repeat),
+            "--result-file",
+            str(result_file),
+        ],
+        cwd=workspace,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{proc.stderr}")
+    return json.loads(result_file.read_text())
+
+
+def run_scenario(name: str, repeat: int, quick: bool) -> Dict[str, Any]:
+    """Prepare a scenario, run it in a child process and return its metrics."""
+    prepare, _ = SCENARIOS[name]
+    base = Path(tempfile.mkdtemp(prefix=f"agi-bench-{name}-"))
+    workspace, volume = base / "workspace", base / "volume"
+    workspace.mkdir()
+    try:
+        if prepare:
+            prepare(workspace, volume, quick)
+        with MockServer(volume) as server:
+            if name == "startup_cold":
+                runs = [
+                    _run_child(name, workspace, server.url, 1, base / f"result{i}.json")
+                    for i in range(repeat)
+                ]
+                samples = [s for run in runs for s in run.pop("samples_s")]
+                metrics = _latency_metrics(samples)
+                metrics["peak_rss_mb"] = max(run["peak_rss_mb"] or 0 for run in runs)
+                return metrics
+            return _run_child(name, workspace, server.url, repeat, base / "result.json")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def _is_higher_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+
+def compare_results(
+    baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float
+) -> List[Dict[str, Any]]:
+    """Return one row per metric present in both runs, flagging regressions."""
+    rows = []
+    for name, base_metrics in baseline.get("scenarios", {}).items():
+        cand_metrics = candidate.get("scenarios", {}).get(name, {})
+        for metric, base_value in base_metrics.items():
+            cand_value = cand_metrics.get(metric)
+            if not isinstance(base_value, (int, float)) or not isinstance(
+                cand_value, (int, float)
+            ):
+                continue
+            if metric in ("files", "bytes") or base_value == 0:
+                continue
+            change = (cand_value - base_value) / base_value
+            worse = -change if _is_higher_better(metric) else change
+            rows.append(
+                {
+                    "scenario": name,
+                    "metric": metric,
+                    "baseline": base_value,
+                    "candidate": cand_value,
+                    "change": change,
+                    "regression": worse > threshold,
+                }
+            )
+    return rows
+
+
+@app.command()
+def run(
+    output: Optional[Path] = typer.Option(
+        None, "--output", "-o", help="Write results to this JSON file"
+    ),
+    scenarios: Optional[str] = typer.Option(
+        None, "--scenarios", help="Comma-separated scenario names (default: all)"
+    ),
+    repeat: int = typer.Option(10, "--repeat", help="Samples for latency scenarios"),
+    quick: bool = typer.Option(False, "--quick", help="Use smaller synthetic trees"),
+):
+    """Run the benchmark scenarios and emit JSON results."""
+    names = scenarios.split(",") if scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        typer.secho(
+            f"Unknown scenarios: {', '.join(unknown)}", fg=typer.colors.RED, err=True
+        )
+        raise typer.Exit(code=1)
+
+    results: Dict[str, Any] = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.time(),
+        "quick": quick,
+        "scenarios": {},
+    }
+    for name in names:
+        typer.echo(f"Running {name}...", err=True)
+        results["scenarios"][name] = run_scenario(name, repeat, quick)
+
+    text = json.dumps(results, indent=2)
+    if output:
+        output.write_text(text)
+    else:
+        typer.echo(text)
+
+
+@app.command()
+def compare(
+    baseline: Path = typer.Argument(..., help="Baseline results JSON"),
+    candidate: Path = typer.Argument(..., help="Candidate results JSON"),
+    threshold: float = typer.Option(
+        0.10, "--threshold", help="Relative change treated as a regression"
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Emit the comparison as JSON"),
+):
+    """Compare two result files; exits with code 1 if any metric regressed."""
+    rows = compare_results(
+        json.loads(baseline.read_text()), json.loads(candidate.read_text()), threshold
+    )
+    if as_json:
+        typer.echo(json.dumps(rows, indent=2))
+    else:
+        for row in rows:
+            marker = "REGRESSION" if row["regression"] else ""
+            typer.echo(
+                f"{row['scenario']:<24} {row['metric']:<20} "
+                f"{row['baseline']:>12.3f} {row['candidate']:>12.3f} "
+                f"{row['change']:>+8.1%} {marker}"
+            )
+    if any(row["regression"] for row in rows):
+        raise typer.Exit(code=1)
+
+
+@app.command(hidden=True)
+def scenario(
+    name: str = typer.Argument(...),
+    api_url: str = typer.Option(..., "--api-url"),
+    repeat: int = typer.Option(1, "--repeat"),
+    result_file: Path = typer.Option(..., "--result-file"),
+):
+    """Measure a single prepared scenario in the current directory."""
+    _, measure = SCENARIOS[name]
+    metrics = measure(api_url, repeat)
+    metrics["peak_rss_mb"] = _peak_rss_mb()
+    result_file.write_text(json.dumps(metrics))
+
+
+def main():
+    app()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,96 +1,178 @@
 # from langsmith import traceable
 import asyncio
 import base64
+import contextlib
+import contextvars
+import hashlib
 import inspect
+import itertools
 import json
 import logging
+import math
 import os
+import posixpath
+import re
+import stat
 import sys
 import tempfile
+import threading
 import time
 import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from dotenv import load_dotenv
 import httpx
 import typer
 
-# Configure logging to suppress HTTPX logs
-logging.getLogger("httpx").setLevel(logging.WARNING)
+from agi_tools_client import endpoints, fileio, progress, tracing
+from agi_tools_client.diagnostics import DEBUG, configure_logging, summarize
+from agi_tools_client.schema import TYPE_MAP, SchemaResolver, schema_type
+from agi_tools_client.store import ObjectStore, volume_key
+from agi_tools_client.syncindex import SyncIndex
 
-logging.basicConfig(
-    level=logging.DEBUG if os.getenv("DEBUG") == "1" else logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Map OpenAPI "type" to Python types.
-TYPE_MAP = {
-    "string": str,
-    "integer": int,
-    "number": float,
-    "boolean": bool,
-    "array": list,
-    "object": dict,
-}
-
 VOLUME_PREFIX = "agitransfer://"
+# Command groups whose commands sync the CWD with the volume before and after running
+SYNC_REQUIRED_GROUPS = {"dagify", "dagent", "schemagin", "datagin"}
+# Comma-separated sync phases ("pre", "post") to skip for every command
+SKIP_SYNC_ENV = "AGI_SKIP_SYNC"
+# Send the command once its referenced files are uploaded; sync the rest meanwhile
+OVERLAP_SYNC_ENV = "AGI_OVERLAP_SYNC"
+UPLOAD_CONCURRENCY = 10
+# Files above this size upload in their own lane, so they cannot hold every slot
+LARGE_UPLOAD_THRESHOLD = 4 * 1024 * 1024
+LARGE_UPLOAD_CONCURRENCY = 3
+# Comma-separated policies deciding which files upload first
+UPLOAD_ORDER_ENV = "AGI_UPLOAD_ORDER"
+DEFAULT_UPLOAD_ORDER = "referenced,recent,small"
+# File ages (seconds) splitting "recent" into buckets; later policies order
+# the files within a bucket
+RECENT_UPLOAD_BUCKETS = (10 * 60, 60 * 60, 24 * 60 * 60)
+# "thread" (default) or "process": where file reading and encoding run during sync
+CPU_POOL_ENV = "AGI_CPU_POOL"
+# Files up to this size are hashed and encoded on the event loop; pool dispatch costs more
+INLINE_CPU_LIMIT = 64 * 1024
+# Larger files are streamed from disk during upload instead of encoded up front
+STREAM_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Downstream sync: "zip" fetches one archive, "fanout" downloads changed files
+# in parallel, "auto" fans out when the server advertises list-directory
+DOWNLOAD_MODE_ENV = "AGI_DOWNLOAD_MODE"
+DOWNLOAD_CONCURRENCY_ENV = "AGI_DOWNLOAD_CONCURRENCY"
+DOWNLOAD_CONCURRENCY = 8
+LIST_DIRECTORY_PATH = "/agitransfer/list-directory"
+# Request-body parameters naming the volume directory a command writes to
+OUTPUT_DIR_PARAMS = ("output_dir",)
+# Assumptions used to estimate transfer time for `agitransfer sync --plan`
+PLAN_BANDWIDTH_MBPS = 10.0
+PLAN_REQUEST_LATENCY = 0.05
 CACHE_TTL = 180  # 3 minutes
-UPLOAD_CACHE_FILE = ".docker_builder_upload_cache.json"
+UPLOAD_CACHE_FILE = ".docker_builder_sync_index"
+# JSON cache written by earlier versions, migrated on first load
+LEGACY_UPLOAD_CACHE_FILE = ".docker_builder_upload_cache.json"
+# Volume directory for file arguments that are not covered by the upstream sync
+ARGUMENT_UPLOAD_DIR = ".agi_args"
+# OpenAPI "format" values that mark a property as a file reference
+FILE_FORMATS = {"binary", "file", "path"}
 
 # Module-level cache variables
 _spec_cache: Optional[Dict[str, Any]] = None
 _spec_cache_time: Optional[float] = None
+_schema_resolver: Optional[SchemaResolver] = None
+_piped_stdin: Optional[str] = None
+
+# Mode open() gives new files; mkstemp() files are owner-only until chmod
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
-# Resolved cache file path
+# Resolved cache file paths
 _upload_cache_file = Path.cwd() / UPLOAD_CACHE_FILE
+_legacy_upload_cache_file = Path.cwd() / LEGACY_UPLOAD_CACHE_FILE
+
+
+def _upload_cache_path(api_url: str) -> Path:
+    """
+    The sync index for api_url. With several endpoints configured each has its
+    own volume, so each gets its own index.
+    """
+    if not endpoints.is_multi_endpoint():
+        return _upload_cache_file
+    suffix = hashlib.sha256(api_url.encode("utf-8")).hexdigest()[:12]
+    return _upload_cache_file.with_name(f"{UPLOAD_CACHE_FILE}-{suffix}")
 
 
 # @traceable
-def _load_upload_cache() -> Dict[str, Dict[str, Any]]:
-    """Load the upload cache from the JSON file."""
-    if _upload_cache_file.exists():
+def _load_upload_cache(api_url: str) -> SyncIndex:
+    """Load the upload cache, migrating the legacy JSON cache if that is all there is."""
+    cache_file = _upload_cache_path(api_url)
+    if cache_file.exists():
         try:
-            with open(_upload_cache_file, "r") as f:
+            cache = SyncIndex.load(cache_file)
+            if DEBUG:
+                logger.debug(
+                    f"Loaded {len(cache)} items from upload cache: {cache_file}"
+                )
+            return cache
+        except (ValueError, OSError) as e:
+            logger.warning(
+                f"Error loading upload cache from {cache_file}: {e}. Ignoring cache."
+            )
+            return SyncIndex()
+    elif cache_file == _upload_cache_file and _legacy_upload_cache_file.exists():
+        try:
+            with open(_legacy_upload_cache_file, "r") as f:
                 cache_data = json.load(f)
-                # Basic validation
-                if isinstance(cache_data, dict):
-                    if os.getenv("DEBUG") == "1":
-                        logger.debug(
-                            f"Loaded {len(cache_data)} items from upload cache: {_upload_cache_file}"
-                        )
-                    return cache_data
-                else:
-                    logger.warning(
-                        f"Invalid cache file format in {_upload_cache_file}. Ignoring cache."
+            if isinstance(cache_data, dict):
+                if DEBUG:
+                    logger.debug(
+                        f"Migrating {len(cache_data)} items from legacy upload cache: {_legacy_upload_cache_file}"
                     )
-                    return {}
+                return SyncIndex.from_mapping(cache_data)
+            logger.warning(
+                f"Invalid cache file format in {_legacy_upload_cache_file}. Ignoring cache."
+            )
         except (json.JSONDecodeError, OSError) as e:
             logger.warning(
-                f"Error loading upload cache from {_upload_cache_file}: {e}. Ignoring cache."
+                f"Error loading upload cache from {_legacy_upload_cache_file}: {e}. Ignoring cache."
             )
-            return {}
+        return SyncIndex()
     else:
-        if os.getenv("DEBUG") == "1":
-            logger.debug(
-                f"Upload cache file not found: {_upload_cache_file}. Starting fresh."
-            )
-        return {}
+        if DEBUG:
+            logger.debug(f"Upload cache file not found: {cache_file}. Starting fresh.")
+        return SyncIndex()
 
 
 # @traceable
-def _save_upload_cache(cache: Dict[str, Dict[str, Any]]):
-    """Save the upload cache to the JSON file."""
+def _save_upload_cache(cache: SyncIndex, api_url: str):
+    """Save the upload cache, dropping entries the last sync did not confirm."""
+    cache_file = _upload_cache_path(api_url)
     try:
-        with open(_upload_cache_file, "w") as f:
-            json.dump(cache, f, indent=2)
-            if os.getenv("DEBUG") == "1":
-                logger.debug(
-                    f"Saved {len(cache)} items to upload cache: {_upload_cache_file}"
-                )
+        cache.compact()
+        cache.save(cache_file)
+        if DEBUG:
+            logger.debug(f"Saved {len(cache)} items to upload cache: {cache_file}")
+        # The index supersedes the legacy JSON cache once written
+        if cache_file == _upload_cache_file and _legacy_upload_cache_file.exists():
+            _legacy_upload_cache_file.unlink()
     except OSError as e:
-        logger.error(f"Error saving upload cache to {_upload_cache_file}: {e}")
+        logger.error(f"Error saving upload cache to {cache_file}: {e}")
 
 
 # @traceable
@@ -109,31 +191,61 @@ def load_openapi_spec() -> Dict[str, Any]:
     ):
         return _spec_cache
 
-    api_url = os.getenv("DOCKER_BUILDER_API_URL", "https://api.agintai.com")
-    url = f"{api_url}/openapi.json"
-
-    if os.getenv("DEBUG") == "1":
-        logger.debug(f"Fetching OpenAPI spec from {url}")
+    # Every endpoint serves the same spec; unreachable ones are skipped
+    api_urls = endpoints.configured_endpoints()
+    router = (
+        endpoints.EndpointRouter.open_default(api_urls) if len(api_urls) > 1 else None
+    )
+    if router is not None:
+        api_urls = router.ranked()
 
     try:
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.get(url)
-            resp.raise_for_status()
-            spec_data = resp.json()
+        for attempt, api_url in enumerate(api_urls, 1):
+            url = f"{api_url}/openapi.json"
 
-            # Update cache
-            _spec_cache = spec_data
-            _spec_cache_time = time.time()
-            if os.getenv("DEBUG") == "1":
-                logger.debug("Updated OpenAPI spec cache.")
+            if DEBUG:
+                logger.debug(f"Fetching OpenAPI spec from {url}")
+
+            try:
+                with httpx.Client(timeout=30.0) as client, tracing.span(
+                    "spec.load", url=url
+                ) as span:
+                    resp = client.get(url)
+                    resp.raise_for_status()
+                    spec_data = resp.json()
+                    span.set("bytes", len(resp.content))
+
+                    # Update cache
+                    _spec_cache = spec_data
+                    _spec_cache_time = time.time()
+                    if DEBUG:
+                        logger.debug("Updated OpenAPI spec cache.")
+
+                    return spec_data
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if attempt == len(api_urls):
+                    logger.error(f"Failed to fetch OpenAPI spec: {str(e)}")
+                    raise typer.Exit(code=1)
+                if router is not None:
+                    router.record_failure(api_url)
+                logger.warning(f"Endpoint {api_url} unreachable ({e}), trying the next")
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to fetch OpenAPI spec: {str(e)}")
+                raise typer.Exit(code=1)
+            except json.JSONDecodeError:
+                logger.error("Invalid OpenAPI spec format received from server")
+                raise typer.Exit(code=1)
+    finally:
+        if router is not None:
+            router.close()
 
-            return spec_data
-    except httpx.HTTPError as e:
-        logger.error(f"Failed to fetch OpenAPI spec: {str(e)}")
-        raise typer.Exit(code=1)
-    except json.JSONDecodeError:
-        logger.error("Invalid OpenAPI spec format received from server")
-        raise typer.Exit(code=1)
+
+def get_schema_resolver(spec: Dict[str, Any]) -> SchemaResolver:
+    """Return the resolver for spec, reusing it while the spec is unchanged."""
+    global _schema_resolver
+    if _schema_resolver is None or _schema_resolver.spec is not spec:
+        _schema_resolver = SchemaResolver(spec)
+    return _schema_resolver
 
 
 # @traceable
@@ -154,15 +266,6 @@ def create_parameter(
     description = prop_spec.get("description", "")
     default = prop_spec.get("default", None)
 
-    # Determine type
-    type_info = prop_spec.get("type", "string")
-    if "anyOf" in prop_spec:
-        types = [t.get("type") for t in prop_spec["anyOf"] if "type" in t]
-        if types:
-            type_info = types[0]
-
-    TYPE_MAP.get(type_info, str)
-
     if is_argument:
         return typer.Argument(
             default=default if not is_required else ...,
@@ -188,307 +291,1049 @@ def create_parameter(
 
 
 # @traceable
-def create_command_function(
-    path_str: str, method: str, operation: Dict[str, Any], spec: Dict[str, Any]
+def is_file_parameter(prop_spec: Dict[str, Any]) -> bool:
+    """
+    Check whether an OpenAPI property describes a file argument, either through
+    the `x-is-file` extension or a file-like `format` on the property itself or
+    one of its `anyOf` variants.
+    """
+    metadata = prop_spec.get("openapi_extra", {})
+    if metadata.get("x-is-file", False):
+        return True
+
+    variants = [prop_spec] + list(prop_spec.get("anyOf", []))
+    return any(
+        isinstance(variant, dict) and variant.get("format") in FILE_FORMATS
+        for variant in variants
+    )
+
+
+def _upload_body_headers(size: int, prefix: bytes, suffix: bytes) -> Dict[str, str]:
+    """Headers for a streamed upload body; a known length avoids chunked encoding."""
+    length = len(prefix) + fileio.base64_length(size) + len(suffix)
+    return {**JSON_HEADERS, "Content-Length": str(length)}
+
+
+async def _stream_upload_body(
+    loop: asyncio.AbstractEventLoop,
+    executor: Executor,
+    path: str,
+    size: int,
+    prefix: bytes,
+    suffix: bytes,
+    on_bytes: Optional[Callable[[int], None]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Yield the upload body of the first size bytes of path chunk by chunk.
+    Reading and encoding each chunk runs in the sync's CPU pool, so only one
+    chunk is in memory at a time. on_bytes is called with the file bytes each
+    chunk carries.
+    """
+    yield prefix
+    for offset in range(0, size, fileio.CHUNK_SIZE):
+        length = min(fileio.CHUNK_SIZE, size - offset)
+        piece = await loop.run_in_executor(
+            executor, fileio.encode_base64_range, path, offset, length
+        )
+        if not piece:
+            # Truncated since it was sized; the length check fails the upload
+            break
+        yield piece
+        if on_bytes is not None:
+            on_bytes(len(piece) * 3 // 4)
+    yield suffix
+
+
+@contextlib.asynccontextmanager
+async def _hold_slot(slot: Optional[asyncio.Semaphore]) -> AsyncIterator[None]:
+    """Hold slot for the duration of the block; None holds nothing."""
+    if slot is None:
+        yield
+        return
+    async with slot:
+        yield
+
+
+def _create_cpu_executor(workers: int) -> Executor:
+    """Create the pool for CPU-bound sync work, as selected by AGI_CPU_POOL."""
+    if os.getenv(CPU_POOL_ENV, "thread") == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agi-encode")
+
+
+async def _run_cpu_stage(
+    loop: asyncio.AbstractEventLoop,
+    executor: Executor,
+    size: int,
+    func: Callable[..., Any],
+    *args: Any,
+) -> Any:
+    """Run per-file CPU work in the pool, or inline when the file is small."""
+    if size <= INLINE_CPU_LIMIT:
+        return func(*args)
+    return await loop.run_in_executor(executor, func, *args)
+
+
+# @traceable
+def _upload_file_argument(api_url: str, agint_apikey: str, path: str) -> str:
+    """
+    Upload a file argument that the upstream sync did not cover (files outside
+    the CWD, hidden files, process substitution) and return its volume reference.
+    Objects are keyed by content hash, so the same input is stored only once.
+    """
+    # Regular files are hashed and sent straight from disk; a pipe can only be
+    # read once, so its content is kept in memory
+    file_bytes: Optional[bytes] = None
+    try:
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+            with tracing.span("file.hash", path=path, bytes=size):
+                digest = fileio.sha256_file(path)
+        else:
+            with open(path, "rb") as f:
+                file_bytes = f.read()
+            size = len(file_bytes)
+            with tracing.span("file.hash", path=path, bytes=size):
+                digest = hashlib.sha256(file_bytes).hexdigest()
+    except OSError as e:
+        typer.secho(
+            f"Error reading file argument {path}: {e}", fg=typer.colors.RED, err=True
+        )
+        raise typer.Exit(code=1)
+
+    name = Path(path).name or "input"
+    destination = f"{VOLUME_PREFIX}{ARGUMENT_UPLOAD_DIR}/{digest[:16]}/{name}"
+
+    store = ObjectStore.open_default()
+    volume = volume_key(api_url, agint_apikey)
+    try:
+        if store is not None and store.has_upload(volume, destination, digest):
+            if DEBUG:
+                logger.debug(f"File argument {path} already uploaded: {destination}")
+        else:
+            _post_file_argument(
+                api_url, agint_apikey, path, destination, size, file_bytes
+            )
+        if store is not None:
+            store.record_uploads(volume, [(destination, digest, size)])
+    finally:
+        if store is not None:
+            store.close()
+    return destination
+
+
+def _post_file_argument(
+    api_url: str,
+    agint_apikey: str,
+    path: str,
+    destination: str,
+    size: int,
+    file_bytes: Optional[bytes] = None,
 ):
-    """Create a command function with dynamic parameters based on OpenAPI spec."""
+    """Upload a file argument, streaming it from path unless file_bytes is given."""
+    if DEBUG:
+        logger.debug(f"Uploading file argument {path} -> {destination}")
 
-    # @traceable
-    def read_file_like(path: str) -> str:
-        """Helper to read content from files, including /dev/fd paths."""
-        try:
-            # Handle process substitution and regular files
-            if path.startswith("/dev/fd/") or os.path.exists(path):
-                try:
-                    with open(path, "r") as f:
-                        return f.read()
-                except (IOError, OSError) as e:
-                    logger.debug(f"Failed to read from {path}: {e}")
-                    return path
-            return path
-        except Exception as e:
-            logger.debug(f"Error processing path {path}: {e}")
-            return path
+    prefix, suffix = fileio.upload_body_frame(destination, agint_apikey)
+    if file_bytes is None:
+        content: Any = itertools.chain([prefix], fileio.iter_base64(path), [suffix])
+    else:
+        content = prefix + base64.b64encode(file_bytes) + suffix
+    try:
+        with httpx.Client(timeout=60.0) as client, tracing.span(
+            "upload", destination=destination, bytes=size
+        ):
+            upload_resp = client.post(
+                f"{api_url}/agitransfer/upload-file",
+                content=content,
+                headers=_upload_body_headers(size, prefix, suffix),
+            )
+            upload_resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        typer.secho(
+            f"Error uploading file argument {path} (HTTP {e.response.status_code}): {e.response.text}",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    except (httpx.RequestError, OSError) as e:
+        typer.secho(
+            f"Error uploading file argument {path}: {str(e)}",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        raise typer.Exit(code=1)
 
-    # @traceable
-    def _background_download_and_unzip(
-        zip_url: str, temp_zip_path: str, target_dir: str
-    ):
-        """Downloads a zip file, extracts it, and cleans up in the background."""
+
+def _parse_object_argument(name: str, text: str) -> Dict[str, Any]:
+    """Parse an object-typed argument given as JSON text; exits if it is not."""
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        typer.secho(
+            f"Error: '{name}' must be a JSON object: {e}",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        raise typer.Exit(code=2)
+    if not isinstance(value, dict):
+        typer.secho(
+            f"Error: '{name}' must be a JSON object, got {type(value).__name__}",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        raise typer.Exit(code=2)
+    return value
+
+
+# @traceable
+def _resolve_file_argument(
+    value: str, synced_files: Container[str], api_url: str, agint_apikey: str
+) -> str:
+    """
+    Turn a file-typed argument into an `agitransfer://` reference. Files already
+    synced from the CWD are referenced in place; anything else is uploaded once.
+    Values that are not local files are passed through unchanged.
+    """
+    if value.startswith(VOLUME_PREFIX):
+        return value
+
+    is_fd = value.startswith("/dev/fd/")
+    if not (is_fd or os.path.isfile(value)):
+        return value
+
+    if not is_fd:
         try:
-            if os.getenv("DEBUG") == "1":
+            relative_path_str = str(
+                Path(os.path.abspath(value)).relative_to(Path.cwd())
+            )
+        except ValueError:
+            relative_path_str = None
+        if relative_path_str in synced_files:
+            if DEBUG:
                 logger.debug(
-                    f"Background: Downloading zip from {zip_url} to {temp_zip_path}"
+                    f"File argument {value} already synced as {relative_path_str}"
                 )
+            return f"{VOLUME_PREFIX}{relative_path_str}"
 
-            # Download the zip file
-            with open(temp_zip_path, "wb") as temp_zip_file:
-                # Use a longer timeout for potentially large downloads
-                with httpx.stream(
-                    "GET", zip_url, timeout=180.0, follow_redirects=True
-                ) as download_resp:
-                    download_resp.raise_for_status()
-                    for chunk in download_resp.iter_bytes():
-                        temp_zip_file.write(chunk)
-
-            download_size = os.path.getsize(temp_zip_path)
-            if os.getenv("DEBUG") == "1":
-                logger.debug(
-                    f"Background: Download complete. Size: {download_size} bytes"
-                )
-            if download_size == 0:
-                logger.warning(
-                    f"Background: Downloaded zip file {temp_zip_path} is empty."
+    return _upload_file_argument(api_url, agint_apikey, value)
+
+
+# @traceable
+def _background_download_and_unzip(
+    zip_url: str, temp_zip_path: str, target_dir: str
+) -> Optional[List[str]]:
+    """
+    Downloads a zip file, extracts it, and cleans up in the background.
+    Returns the extracted members, or None if nothing was extracted.
+    """
+    try:
+        if DEBUG:
+            logger.debug(
+                f"Background: Downloading zip from {zip_url} to {temp_zip_path}"
+            )
+
+        # Download the zip file
+        with open(temp_zip_path, "wb") as temp_zip_file:
+            # Use a longer timeout for potentially large downloads
+            with httpx.stream(
+                "GET", zip_url, timeout=180.0, follow_redirects=True
+            ) as download_resp, tracing.span("zip.download") as span, progress.task(
+                "download"
+            ) as download_progress:
+                download_resp.raise_for_status()
+                # The total is unknown when the archive is streamed chunked
+                download_progress.add_total(
+                    nbytes=int(download_resp.headers.get("content-length", 0))
                 )
+                download_progress.request_started()
+                for chunk in download_resp.iter_bytes():
+                    temp_zip_file.write(chunk)
+                    span.add("bytes", len(chunk))
+                    download_progress.add_bytes(len(chunk))
+                download_progress.request_finished()
+
+        download_size = os.path.getsize(temp_zip_path)
+        if DEBUG:
+            logger.debug(f"Background: Download complete. Size: {download_size} bytes")
+        if download_size == 0:
+            logger.warning(f"Background: Downloaded zip file {temp_zip_path} is empty.")
+
+        # Unzip the file, overwriting existing files
+        if DEBUG:
+            logger.debug(
+                f"Background: Unzipping {temp_zip_path} to {target_dir}, overwriting."
+            )
 
-            # Unzip the file, overwriting existing files
-            if os.getenv("DEBUG") == "1":
+        with zipfile.ZipFile(temp_zip_path, "r") as zip_ref, tracing.span(
+            "zip.extract", archive_bytes=download_size
+        ) as span:
+            # Check for potentially harmful paths
+            members_to_extract = []
+            for member in zip_ref.namelist():
+                if not _is_safe_member(member):
+                    logger.error(
+                        f"Background: Zip archive contains potentially unsafe path: {member}. Skipping extraction."
+                    )
+                    # Optionally raise an error or just skip the file/archive
+                    return None  # Stop processing this zip if unsafe path detected
+                elif member == ".zip":
+                    if DEBUG:
+                        logger.debug(
+                            "Background: Skipping extraction of unwanted '.zip' entry."
+                        )
+                elif member.startswith(ARGUMENT_UPLOAD_DIR + "/"):
+                    # Uploaded file arguments only need to live on the volume
+                    continue
+                else:
+                    members_to_extract.append(member)
+
+            if DEBUG:
                 logger.debug(
-                    f"Background: Unzipping {temp_zip_path} to {target_dir}, overwriting."
+                    f"Background: Extracting {len(members_to_extract)} members to {target_dir}"
                 )
+            zip_ref.extractall(target_dir, members=members_to_extract)
+            span.set("files", len(members_to_extract))
 
-            with zipfile.ZipFile(temp_zip_path, "r") as zip_ref:
-                # Check for potentially harmful paths
-                members_to_extract = []
-                for member in zip_ref.namelist():
-                    if member.startswith("/") or ".." in member:
-                        logger.error(
-                            f"Background: Zip archive contains potentially unsafe path: {member}. Skipping extraction."
-                        )
-                        # Optionally raise an error or just skip the file/archive
-                        return  # Stop processing this zip if unsafe path detected
-                    elif member == ".zip":
-                        if os.getenv("DEBUG") == "1":
-                            logger.debug(
-                                "Background: Skipping extraction of unwanted '.zip' entry."
-                            )
-                    else:
-                        members_to_extract.append(member)
+        if DEBUG:
+            logger.debug("Background: Unzip complete.")
+        return members_to_extract
 
-                if os.getenv("DEBUG") == "1":
+    except httpx.HTTPStatusError as e:
+        logger.error(
+            f"Background sync error (HTTP {e.response.status_code}): {e.request.url}. Response: {e.response.text}"
+        )
+    except httpx.RequestError as e:
+        logger.error(f"Background sync error (Request): {str(e)}")
+    except zipfile.BadZipFile:
+        logger.error(
+            f"Background sync error: Downloaded file {temp_zip_path} is not a valid zip."
+        )
+    except OSError as e:
+        logger.error(f"Background sync error (File System): {str(e)}")
+    except Exception:
+        logger.exception("Unexpected background sync error:")  # Log full traceback
+    finally:
+        # Clean up temporary zip file
+        if os.path.exists(temp_zip_path):
+            try:
+                os.remove(temp_zip_path)
+                if DEBUG:
                     logger.debug(
-                        f"Background: Extracting {len(members_to_extract)} members to {target_dir}"
+                        f"Background: Cleaned up temporary zip file: {temp_zip_path}"
                     )
-                zip_ref.extractall(target_dir, members=members_to_extract)
+            except OSError as e:
+                logger.error(
+                    f"Background: Failed to remove temporary zip file {temp_zip_path}: {e}"
+                )
+    return None
 
-            if os.getenv("DEBUG") == "1":
-                logger.debug("Background: Unzip complete.")
 
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                f"Background sync error (HTTP {e.response.status_code}): {e.request.url}. Response: {e.response.text}"
+def _use_fanout_download() -> bool:
+    mode = os.getenv(DOWNLOAD_MODE_ENV, "auto").lower()
+    if mode in ("zip", "fanout"):
+        return mode == "fanout"
+    return bool(_spec_cache) and LIST_DIRECTORY_PATH in _spec_cache.get("paths", {})
+
+
+def _list_directory_payload(agint_apikey: str, directory: str) -> Dict[str, Any]:
+    return {
+        "agint_apikey": agint_apikey,
+        "directory_path": VOLUME_PREFIX + (directory or "/"),
+        "api_key": agint_apikey,
+    }
+
+
+def _wanted_remote_entries(
+    entries: List[Dict[str, Any]], directory: str
+) -> List[Dict[str, Any]]:
+    """Drop malformed, unsafe and uploaded-argument entries from a listing."""
+    wanted = []
+    for entry in entries:
+        member = entry.get("path", "")
+        if not member or "url" not in entry:
+            logger.error(f"Skipping malformed remote entry: {entry}")
+        elif not _is_safe_member(member):
+            logger.error(f"Skipping unsafe remote path: {member}")
+        elif not posixpath.join(directory, member).startswith(
+            ARGUMENT_UPLOAD_DIR + "/"
+        ):
+            wanted.append(entry)
+    return wanted
+
+
+def _download_concurrency() -> int:
+    try:
+        return max(1, int(os.getenv(DOWNLOAD_CONCURRENCY_ENV, DOWNLOAD_CONCURRENCY)))
+    except ValueError:
+        logger.warning(
+            f"Invalid {DOWNLOAD_CONCURRENCY_ENV}, using {DOWNLOAD_CONCURRENCY}"
+        )
+        return DOWNLOAD_CONCURRENCY
+
+
+def _is_safe_member(member: str) -> bool:
+    return not (member.startswith("/") or ".." in member)
+
+
+# @traceable
+async def _download_file(
+    client: httpx.AsyncClient,
+    url: str,
+    target: Path,
+    on_bytes: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Stream url into target atomically: the body goes to a temporary file next
+    to target, which then replaces it, so readers never see a partial file.
+    on_bytes is called with the size of each chunk received.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=str(target.parent), prefix=f".{target.name}.", suffix=".part"
+    )
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async with client.stream("GET", url) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes():
+                    f.write(chunk)
+                    written += len(chunk)
+                    if on_bytes is not None:
+                        on_bytes(len(chunk))
+        # Keep the mode of the file being replaced, as the zip extraction does
+        try:
+            mode = stat.S_IMODE(target.stat().st_mode)
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+# @traceable
+def _fanout_download(
+    api_url: str, agint_apikey: str, target_dir: str, directory: str = ""
+) -> bool:
+    """
+    Lists a volume directory and downloads every remote file that differs from
+    its local copy, several at a time. Returns False if the server cannot list
+    the volume, so the caller can fall back to the zip download.
+    """
+    concurrency = _download_concurrency()
+    target_root = Path(target_dir) / directory
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    store = ObjectStore.open_default()
+    volume = volume_key(api_url, agint_apikey)
+    store_records: List[Tuple[str, str, int]] = []
+    download_progress = progress.task("download")
+
+    async def is_current(local_path: Path, entry: Dict[str, Any]) -> bool:
+        digest, size = entry.get("sha256"), entry.get("size")
+        try:
+            if not digest or local_path.stat().st_size != size:
+                return False
+        except OSError:
+            return False
+        with tracing.span("file.hash", path=entry["path"], bytes=size):
+            local_digest = await _run_cpu_stage(
+                loop, None, size, fileio.sha256_file, str(local_path)
             )
-        except httpx.RequestError as e:
-            logger.error(f"Background sync error (Request): {str(e)}")
-        except zipfile.BadZipFile:
-            logger.error(
-                f"Background sync error: Downloaded file {temp_zip_path} is not a valid zip."
+        return local_digest == digest
+
+    async def fetch(
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        entry: Dict[str, Any],
+    ) -> Optional[int]:
+        member = entry["path"]
+        local_path = target_root / member
+        if await is_current(local_path, entry):
+            if DEBUG:
+                logger.debug(f"Skipping unchanged remote file: {member}")
+            download_progress.file_skipped(entry.get("size") or 0)
+            return 0
+        async with semaphore:
+            download_progress.request_started()
+            try:
+                with tracing.span("file.download", path=member) as span:
+                    written = await _download_file(
+                        client, entry["url"], local_path, download_progress.add_bytes
+                    )
+                    span.set("bytes", written)
+            except httpx.HTTPStatusError as e:
+                logger.error(
+                    f"Download failed for {member} (HTTP {e.response.status_code})"
+                )
+                download_progress.file_failed()
+                return None
+            except (httpx.RequestError, OSError) as e:
+                logger.error(f"Download failed for {member}: {e}")
+                download_progress.file_failed()
+                return None
+            finally:
+                download_progress.request_finished()
+        download_progress.file_done()
+        if DEBUG:
+            logger.debug(f"Downloaded {member} ({written} bytes)")
+        return written
+
+    async def run() -> bool:
+        limits = httpx.Limits(
+            max_connections=concurrency, max_keepalive_connections=concurrency
+        )
+        async with httpx.AsyncClient(
+            timeout=180.0, limits=limits, follow_redirects=True
+        ) as client:
+            payload = _list_directory_payload(agint_apikey, directory)
+            with tracing.span("volume.list", directory=directory or "/") as span:
+                resp = await client.post(
+                    f"{api_url}{LIST_DIRECTORY_PATH}", json=payload
+                )
+                if resp.status_code in (404, 405):
+                    return False
+                resp.raise_for_status()
+                entries = json.loads(resp.json().get("stdout") or "[]")
+                span.set("files", len(entries))
+
+            wanted = _wanted_remote_entries(entries, directory)
+
+            # Record what the volume holds, so the next upstream sync can skip
+            # re-uploading it; a failed download does not change the volume
+            store_records.extend(
+                (
+                    f"{VOLUME_PREFIX}{posixpath.join(directory, entry['path'])}",
+                    entry["sha256"],
+                    entry.get("size") or 0,
+                )
+                for entry in wanted
+                if entry.get("sha256")
             )
-        except OSError as e:
-            logger.error(f"Background sync error (File System): {str(e)}")
-        except Exception:
-            logger.exception("Unexpected background sync error:")  # Log full traceback
-        finally:
-            # Clean up temporary zip file
-            if os.path.exists(temp_zip_path):
+            semaphore = asyncio.Semaphore(concurrency)
+            download_progress.add_total(
+                len(wanted), sum(entry.get("size") or 0 for entry in wanted)
+            )
+            with tracing.span(
+                "download.fanout", files=len(wanted), concurrency=concurrency
+            ) as span, download_progress:
+                results = await asyncio.gather(
+                    *(fetch(client, semaphore, entry) for entry in wanted)
+                )
+                downloaded = [r for r in results if r]
+                span.set("downloaded", len(downloaded))
+                span.set("bytes", sum(downloaded))
+                span.set("failed", sum(1 for r in results if r is None))
+            if DEBUG:
+                logger.debug(
+                    f"Fan-out download: {len(downloaded)} of {len(wanted)} files changed"
+                )
+            return True
+
+    try:
+        listed = loop.run_until_complete(run())
+        if store is not None:
+            store.record_uploads(volume, store_records)
+        return listed
+    finally:
+        loop.close()
+        if store is not None:
+            store.close()
+
+
+def _normalize_volume_dir(path: str) -> Optional[str]:
+    """
+    Turn a directory or agitransfer:// URI into a path relative to the volume
+    root. Returns "" for the root itself and None for paths outside the volume.
+    """
+    if path.startswith(VOLUME_PREFIX):
+        path = path[len(VOLUME_PREFIX) :].lstrip("/")
+    elif os.path.isabs(path):
+        return None
+    normalized = posixpath.normpath(path.replace(os.sep, "/"))
+    if normalized == ".":
+        return ""
+    if normalized.startswith("/") or normalized.split("/")[0] == "..":
+        return None
+    return normalized
+
+
+def _collapse_directories(directories: List[str]) -> Optional[List[str]]:
+    """Drop directories nested in others; None if the volume root is included."""
+    if "" in directories:
+        return None
+    collapsed: List[str] = []
+    for directory in sorted(set(directories)):
+        if not any(directory.startswith(parent + "/") for parent in collapsed):
+            collapsed.append(directory)
+    return collapsed
+
+
+def _post_sync_scope(
+    kwargs: Dict[str, Any], response: Dict[str, Any]
+) -> Optional[List[str]]:
+    """
+    Work out which volume directories a command wrote to: the directories of
+    the artifacts the server reports, else its output directory arguments.
+    None means nothing is known and the whole volume must be synced.
+    """
+    artifacts = response.get("artifacts")
+    if isinstance(artifacts, list) and artifacts:
+        files = [_normalize_volume_dir(str(artifact)) for artifact in artifacts]
+        directories = [
+            posixpath.dirname(path) if path is not None else None for path in files
+        ]
+    else:
+        directories = [
+            _normalize_volume_dir(kwargs[name])
+            for name in OUTPUT_DIR_PARAMS
+            if isinstance(kwargs.get(name), str) and kwargs[name]
+        ]
+    if not directories or None in directories:
+        return None
+    return _collapse_directories(directories)
+
+
+# @traceable
+def _synchronize_user_directory(
+    api_url: str, agint_apikey: str, directories: Optional[List[str]] = None
+):
+    """
+    Brings volume directories (relative to its root) into the same paths under
+    the CWD; the whole volume when directories is None.
+    """
+    # Shared store records there are stale; the downloads record them anew
+    _forget_volume_uploads(api_url, agint_apikey, directories)
+    for directory in directories or [""]:
+        _synchronize_directory(api_url, agint_apikey, directory)
+
+
+def _forget_volume_uploads(
+    api_url: str, agint_apikey: str, directories: Optional[List[str]]
+):
+    """
+    Drop the shared store records under volume directories (the whole volume
+    when None), whose content a command may have changed.
+    """
+    store = ObjectStore.open_default()
+    if store is None:
+        return
+    try:
+        store.forget(
+            volume_key(api_url, agint_apikey),
+            [
+                f"{VOLUME_PREFIX}{directory}/" if directory else VOLUME_PREFIX
+                for directory in directories or [""]
+            ],
+        )
+    finally:
+        store.close()
+
+
+def _record_extracted_files(
+    api_url: str,
+    agint_apikey: str,
+    directory: str,
+    target_dir: str,
+    members: List[str],
+):
+    """
+    Record the content of files extracted from a volume archive in the shared
+    store, as the fan-out download does from the volume listing.
+    """
+    store = ObjectStore.open_default()
+    if store is None:
+        return
+    records = []
+    try:
+        with tracing.span("zip.hash", files=len(members)):
+            for member in members:
+                local_path = os.path.join(target_dir, member)
+                if member.endswith("/") or not os.path.isfile(local_path):
+                    continue
                 try:
-                    os.remove(temp_zip_path)
-                    if os.getenv("DEBUG") == "1":
-                        logger.debug(
-                            f"Background: Cleaned up temporary zip file: {temp_zip_path}"
-                        )
+                    digest = fileio.sha256_file(local_path)
+                    size = os.path.getsize(local_path)
                 except OSError as e:
-                    logger.error(
-                        f"Background: Failed to remove temporary zip file {temp_zip_path}: {e}"
+                    logger.warning(f"Could not hash extracted file {member}: {e}")
+                    continue
+                records.append(
+                    (
+                        f"{VOLUME_PREFIX}{posixpath.join(directory, member)}",
+                        digest,
+                        size,
                     )
+                )
+        store.record_uploads(volume_key(api_url, agint_apikey), records)
+    finally:
+        store.close()
 
-    # @traceable
-    def _synchronize_user_directory(api_url: str, agint_apikey: str):
-        """Calls agitransfer zip-directory and starts a background download/unzip."""
-        zip_url = None
-        temp_zip_path = None  # Keep track of the path for cleanup if thread fails early
+
+# @traceable
+def _synchronize_directory(api_url: str, agint_apikey: str, directory: str):
+    """
+    Brings one volume directory into the CWD: by parallel per-file downloads
+    when the server can list the volume, otherwise via agitransfer zip-directory.
+    """
+    if _use_fanout_download():
         try:
-            # Step 1: Call zip-directory endpoint
-            zip_endpoint_url = f"{api_url}/agitransfer/zip-directory"
-            zip_payload = {
-                "agint_apikey": agint_apikey,
-                "directory_path": VOLUME_PREFIX + "/",
-                "verbose": os.getenv("DEBUG") == "1",
-                "api_key": agint_apikey,
-            }
-            if os.getenv("DEBUG") == "1":
-                logger.debug(f"Initiating sync: Calling {zip_endpoint_url}")
-                logger.debug(f"Zip payload: {json.dumps(zip_payload, indent=2)}")
-
-            with httpx.Client(timeout=60.0) as client:
+            if _fanout_download(api_url, agint_apikey, os.getcwd(), directory):
+                return
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Fan-out download unavailable, using zip: {e}")
+        if DEBUG:
+            logger.debug("Server cannot list the volume; falling back to zip")
+
+    zip_url = None
+    temp_zip_path = None  # Keep track of the path for cleanup if thread fails early
+    try:
+        # Step 1: Call zip-directory endpoint
+        zip_endpoint_url = f"{api_url}/agitransfer/zip-directory"
+        zip_payload = {
+            "agint_apikey": agint_apikey,
+            "directory_path": VOLUME_PREFIX + (directory or "/"),
+            "verbose": DEBUG,
+            "api_key": agint_apikey,
+        }
+        if DEBUG:
+            logger.debug(f"Initiating sync: Calling {zip_endpoint_url}")
+            logger.debug("Zip payload: %s", summarize(zip_payload))
+
+        with httpx.Client(timeout=60.0) as client:
+            with tracing.span("zip.create", directory=zip_payload["directory_path"]):
                 zip_resp = client.post(zip_endpoint_url, json=zip_payload)
 
-                if os.getenv("DEBUG") == "1":
-                    logger.debug(f"Zip response status: {zip_resp.status_code}")
-                    logger.debug(f"Zip response body: {zip_resp.text}")
+            if DEBUG:
+                logger.debug(f"Zip response status: {zip_resp.status_code}")
+                logger.debug("Zip response body: %s", summarize(zip_resp.text))
 
-                if zip_resp.status_code == 400:
-                    try:
-                        error_data = zip_resp.json()
-                        # Decode base64 stderr, then decode bytes to string
-                        stderr_bytes = base64.b64decode(error_data.get("stderr", ""))
-                        error_data["stderr"] = stderr_bytes.decode("utf-8", errors="replace") # Decode bytes to str
-                        
-                        error_msg = (
-                            f"Sync failed (zip step - 400): {json.dumps(error_data)}"
-                        )
-                    except (json.JSONDecodeError, base64.binascii.Error, UnicodeDecodeError) as decode_err:
-                        # Handle potential errors during decoding or JSON parsing
-                        logger.error(f"Error processing 400 response body: {decode_err}")
-                        error_msg = f"Sync failed (zip step - 400): {zip_resp.text}"
-                    typer.secho(error_msg, fg=typer.colors.RED, err=True)
-                    # Don't exit, just log and skip background download
-                    logger.error(error_msg)
-                    return
-
-                zip_resp.raise_for_status()  # Handle other HTTP errors
-                zip_data = zip_resp.json()
-                zip_url = zip_data.get("stdout")
-
-                if not zip_url or not zip_url.startswith("http"):
-                    error_msg = "Error: Sync failed - could not get a valid zip URL from response."
-                    typer.secho(error_msg, fg=typer.colors.RED, err=True)
-                    logger.error(
-                        f"Zip response missing or invalid stdout URL: {zip_data}"
+            if zip_resp.status_code == 400:
+                try:
+                    error_data = zip_resp.json()
+                    # Decode base64 stderr, then decode bytes to string
+                    stderr_bytes = base64.b64decode(error_data.get("stderr", ""))
+                    error_data["stderr"] = stderr_bytes.decode(
+                        "utf-8", errors="replace"
+                    )  # Decode bytes to str
+
+                    error_msg = (
+                        f"Sync failed (zip step - 400): {json.dumps(error_data)}"
                     )
-                    # Don't exit, log and skip background download
-                    return
-
-            if os.getenv("DEBUG") == "1":
-                logger.debug(f"Zip URL obtained: {zip_url}")
-
-            # Step 2: Prepare for background download
-            # Create a temporary file path without creating the file
-            temp_zip_path = tempfile.mktemp(suffix=".zip")
-            target_dir = os.getcwd()
-
-            if os.getenv("DEBUG") == "1":
-                logger.debug(
-                    f"Starting background download to {temp_zip_path} for extraction to {target_dir}"
+                except (
+                    json.JSONDecodeError,
+                    base64.binascii.Error,
+                    UnicodeDecodeError,
+                ) as decode_err:
+                    # Handle potential errors during decoding or JSON parsing
+                    logger.error(f"Error processing 400 response body: {decode_err}")
+                    error_msg = f"Sync failed (zip step - 400): {zip_resp.text}"
+                typer.secho(error_msg, fg=typer.colors.RED, err=True)
+                # Don't exit, just log and skip background download
+                logger.error(error_msg)
+                return
+
+            zip_resp.raise_for_status()  # Handle other HTTP errors
+            zip_data = zip_resp.json()
+            zip_url = zip_data.get("stdout")
+
+            if not zip_url or not zip_url.startswith("http"):
+                error_msg = (
+                    "Error: Sync failed - could not get a valid zip URL from response."
                 )
+                typer.secho(error_msg, fg=typer.colors.RED, err=True)
+                logger.error(f"Zip response missing or invalid stdout URL: {zip_data}")
+                # Don't exit, log and skip background download
+                return
 
-            # Step 3: Run download/unzip directly in main thread
-            _background_download_and_unzip(zip_url, temp_zip_path, target_dir)
+        if DEBUG:
+            logger.debug(f"Zip URL obtained: {zip_url}")
 
-            if os.getenv("DEBUG") == "1":
-                logger.debug(
-                    "Background download thread started. Main command continues."
-                )
+        # Step 2: Prepare for background download
+        # Create a temporary file path without creating the file
+        temp_zip_path = tempfile.mktemp(suffix=".zip")
+        target_dir = os.path.join(os.getcwd(), directory)
 
-        except httpx.HTTPStatusError as e:
-            error_body = e.response.text
-            try:
-                error_body = json.dumps(e.response.json(), indent=2)
-            except json.JSONDecodeError:
-                pass
-            typer.secho(
-                f"Error initiating sync (HTTP {e.response.status_code}): {e.request.url}",
-                fg=typer.colors.RED,
-                err=True,
-            )
-            typer.secho(f"Response body: {error_body}", err=True)
-            logger.error(
-                f"Sync initiation HTTPStatusError: Status={e.response.status_code}, Body={e.response.text}, URL={e.request.url}"
+        if DEBUG:
+            logger.debug(
+                f"Starting background download to {temp_zip_path} for extraction to {target_dir}"
             )
-            # Don't exit here, allow command to potentially finish anyway
-        except httpx.RequestError as e:
-            typer.secho(
-                f"Error initiating sync (Request): {str(e)}",
-                fg=typer.colors.RED,
-                err=True,
+
+        # Step 3: Run download/unzip directly in main thread
+        extracted = _background_download_and_unzip(zip_url, temp_zip_path, target_dir)
+        if extracted:
+            _record_extracted_files(
+                api_url, agint_apikey, directory, target_dir, extracted
             )
-            logger.error(f"Sync initiation RequestError: {e}")
-            # Don't exit here
-        except Exception as e:
-            typer.secho(
-                f"An unexpected error occurred during sync initiation: {str(e)}",
-                fg=typer.colors.RED,
-                err=True,
+
+        if DEBUG:
+            logger.debug("Background download thread started. Main command continues.")
+
+    except httpx.HTTPStatusError as e:
+        error_body = e.response.text
+        try:
+            error_body = json.dumps(e.response.json(), indent=2)
+        except json.JSONDecodeError:
+            pass
+        typer.secho(
+            f"Error initiating sync (HTTP {e.response.status_code}): {e.request.url}",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        typer.secho(f"Response body: {error_body}", err=True)
+        logger.error(
+            f"Sync initiation HTTPStatusError: Status={e.response.status_code}, Body={e.response.text}, URL={e.request.url}"
+        )
+        # Don't exit here, allow command to potentially finish anyway
+    except httpx.RequestError as e:
+        typer.secho(
+            f"Error initiating sync (Request): {str(e)}",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        logger.error(f"Sync initiation RequestError: {e}")
+        # Don't exit here
+    except Exception as e:
+        typer.secho(
+            f"An unexpected error occurred during sync initiation: {str(e)}",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        logger.exception("Unexpected sync initiation error:")
+        # Don't exit here
+
+    # NOTE: The main command flow continues immediately after starting the thread.
+    # No waiting, no direct error handling for the background process here.
+    # Cleanup of the temp file is handled within the background thread.
+
+
+# @traceable
+def _scan_workspace(cwd: Path) -> List[Path]:
+    """List the non-hidden files under CWD that take part in the upstream sync."""
+    files = []
+    cache_file = _upload_cache_file.resolve()
+    with tracing.span("file.scan") as scan_span:
+        for item in cwd.rglob("*"):
+            # Check if any part of the path starts with '.'
+            is_hidden = any(
+                part.startswith(".") for part in item.relative_to(cwd).parts
             )
-            logger.exception("Unexpected sync initiation error:")
-            # Don't exit here
-
-        # NOTE: The main command flow continues immediately after starting the thread.
-        # No waiting, no direct error handling for the background process here.
-        # Cleanup of the temp file is handled within the background thread.
-
-    def _perform_upstream_sync(api_url: str, agint_apikey: str):
-        """Scans CWD, filters hidden files, checks cache, and uploads changes in parallel."""
-        sync_endpoint = f"{api_url}/agitransfer/upload-file"
-        cwd = Path.cwd()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        semaphore = asyncio.Semaphore(10)  # Limit concurrency
-
-        # Load the existing cache
-        upload_cache = _load_upload_cache()
-        new_upload_cache = {}  # Store results for the *new* cache
-
-        # @traceable # Inner functions might not be traceable correctly this way
-        async def upload_item(
-            item_path: Path,
-            client: httpx.AsyncClient,
-            cache: Dict[str, Dict[str, Any]],
-        ) -> Optional[Tuple[str, float, int, bool]]:
-            """
-            Checks cache, uploads a file if needed, and returns its status.
-            Returns: (relative_path, mtime, size, was_skipped) or None on error.
-            """
-            relative_path_str = str(item_path.relative_to(cwd))
-            destination = f"{VOLUME_PREFIX}{relative_path_str}"
+            if is_hidden:
+                # Don't log skipping the cache file every time
+                if DEBUG and item.resolve() != cache_file:
+                    logger.debug(f"Skipping hidden item: {item}")
+                continue
+            # The cache file itself is hidden, but a link may still lead to it
+            if item.is_symlink() and item.resolve() == cache_file:
+                continue
+
+            if item.is_file():
+                files.append(item)
+            elif item.is_dir():
+                if DEBUG:
+                    logger.debug(f"Skipping directory (upload not implemented): {item}")
+        scan_span.set("files", len(files))
+    return files
+
+
+def _is_large_upload(size: int) -> bool:
+    """Whether a file of size bytes uploads in the large-file lane."""
+    return size > LARGE_UPLOAD_THRESHOLD
+
+
+def _order_uploads(
+    files: List[Path], cwd: Path, priority: Set[str]
+) -> List[Tuple[Path, os.stat_result]]:
+    """
+    Stat scanned files and sort them by the AGI_UPLOAD_ORDER policies, applied
+    in turn: "referenced" (files the command was given), "recent" (modified
+    within the last 10 minutes, hour, day, then older) and "small" (smallest
+    first). Ties keep scan order; "scan" alone keeps it throughout.
+    """
+    now = time.time()
+    policy_keys: Dict[str, Callable[[str, os.stat_result], Any]] = {
+        "referenced": lambda rel, st: rel not in priority,
+        "recent": lambda rel, st: sum(
+            now - st.st_mtime > age for age in RECENT_UPLOAD_BUCKETS
+        ),
+        "small": lambda rel, st: st.st_size,
+    }
+    policies = [
+        p.strip().lower()
+        for p in os.getenv(UPLOAD_ORDER_ENV, DEFAULT_UPLOAD_ORDER).split(",")
+        if p.strip()
+    ]
+    for policy in policies:
+        if policy not in policy_keys and policy != "scan":
+            logger.warning(f"Ignoring unknown {UPLOAD_ORDER_ENV} policy: {policy}")
+    keys = [policy_keys[p] for p in policies if p in policy_keys]
+
+    entries = []
+    for item in files:
+        try:
+            entries.append((item, str(item.relative_to(cwd)), item.stat()))
+        except OSError as e:
+            logger.error(f"Error reading file {item}: {e}")
+    if keys:
+        entries.sort(key=lambda e: tuple(key(e[1], e[2]) for key in keys))
+    return [(item, st) for item, _, st in entries]
 
-            try:
-                current_mtime = item_path.stat().st_mtime
-                current_size = item_path.stat().st_size
-                cached_info = cache.get(relative_path_str)
-
-                if (
-                    cached_info
-                    and cached_info.get("mtime") == current_mtime
-                    and cached_info.get("size") == current_size
+
+# @traceable
+def _perform_upstream_sync(
+    api_url: str,
+    agint_apikey: str,
+    priority: Optional[Set[str]] = None,
+    on_priority_synced: Optional[Callable[[Set[str]], None]] = None,
+) -> Container[str]:
+    """
+    Scans CWD, filters hidden files, checks cache, and uploads changes in parallel.
+    Returns the sync index, which contains the relative paths that are known to
+    be present on the volume.
+
+    Files in priority are scheduled first; once they have all finished,
+    on_priority_synced is called with those that are on the volume.
+    """
+    priority = priority or set()
+    sync_endpoint = f"{api_url}/agitransfer/upload-file"
+    cwd = Path.cwd()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)  # Limit concurrency
+    large_lane = asyncio.Semaphore(LARGE_UPLOAD_CONCURRENCY)
+    # Reading and encoding run in a CPU pool so the loop keeps the network busy
+    cpu_workers = os.cpu_count() or 1
+    cpu_executor = _create_cpu_executor(cpu_workers)
+    buffer_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY + cpu_workers)
+
+    # Load the existing cache; it is updated in place as files are confirmed
+    upload_cache = _load_upload_cache(api_url)
+
+    # Host-wide record of uploads, shared with other checkouts
+    store = ObjectStore.open_default()
+    volume = volume_key(api_url, agint_apikey)
+    store_records: List[Tuple[str, str, int]] = []
+    sync_progress = progress.task("upload")
+
+    # @traceable # Inner functions might not be traceable correctly this way
+    async def upload_item(
+        item_path: Path,
+        item_stat: os.stat_result,
+        client: httpx.AsyncClient,
+        cache: SyncIndex,
+    ) -> Optional[bool]:
+        """
+        Checks cache, uploads a file if needed, and returns its status.
+        Returns: True if uploaded, False if skipped, or None on error.
+        """
+        relative_path_str = str(item_path.relative_to(cwd))
+        destination = f"{VOLUME_PREFIX}{relative_path_str}"
+
+        try:
+            current_mtime = item_stat.st_mtime
+            current_size = item_stat.st_size
+
+            if cache.is_current(relative_path_str, current_mtime, current_size):
+                if DEBUG:
+                    logger.debug(f"Skipping cached file: {relative_path_str}")
+                cache.mark(relative_path_str, current_mtime, current_size)
+                return False  # Skipped
+
+            # Another checkout on this host may already have pushed these bytes
+            digest = None
+            if store is not None:
+                with tracing.span(
+                    "file.hash", path=relative_path_str, bytes=current_size
                 ):
-                    if os.getenv("DEBUG") == "1":
-                        logger.debug(f"Skipping cached file: {relative_path_str}")
-                    # Return info indicating it was skipped
-                    return (relative_path_str, current_mtime, current_size, True)
-
-                # If not cached or changed, proceed with upload
-                if os.getenv("DEBUG") == "1":
-                    action = "Uploading new" if not cached_info else "Uploading changed"
-                    logger.debug(f"{action} file: {relative_path_str} -> {destination}")
-
-                async with semaphore:
-                    if os.getenv("DEBUG") == "1":
+                    digest = await _run_cpu_stage(
+                        loop,
+                        cpu_executor,
+                        current_size,
+                        fileio.sha256_file,
+                        str(item_path),
+                    )
+                if store.has_upload(volume, destination, digest):
+                    if DEBUG:
                         logger.debug(
-                            f"Uploading JSON: {relative_path_str} (Semaphore acquired)"
-                        )
-                    try:
-                        # Read file content as bytes
-                        file_bytes = item_path.read_bytes()
-                        # Encode bytes as base64 string
-                        file_content_base64 = base64.b64encode(file_bytes).decode(
-                            "utf-8"
+                            f"Skipping file already in shared store: {relative_path_str}"
                         )
+                    store_records.append((destination, digest, current_size))
+                    cache.mark(relative_path_str, current_mtime, current_size)
+                    return False  # Skipped
 
-                        # Construct JSON payload
-                        payload = {
-                            "destination": destination,
-                            "agint_apikey": agint_apikey,
-                            "source": file_content_base64,
-                            "api_key": agint_apikey,
-                        }
+            # If not cached or changed, proceed with upload
+            if DEBUG:
+                logger.debug(
+                    f"Uploading new or changed file: {relative_path_str} -> {destination}"
+                )
 
-                        # Use a reasonable timeout for uploads
-                        upload_resp = await client.post(
-                            sync_endpoint, json=payload, timeout=60.0
-                        )  # Send as JSON
+            # Hold a buffer slot from encoding until the upload finishes, so at
+            # most UPLOAD_CONCURRENCY + cpu_workers encoded bodies are in memory.
+            # Large files encode and upload in their own lane instead, so they
+            # progress next to the small files ordered ahead of them rather
+            # than queue behind every one.
+            large = _is_large_upload(current_size)
+            async with large_lane if large else buffer_slots:
+                if current_size > STREAM_UPLOAD_THRESHOLD:
+                    # Large files go out chunk by chunk, never held whole
+                    prefix, suffix = fileio.upload_body_frame(destination, agint_apikey)
+                    headers = _upload_body_headers(current_size, prefix, suffix)
+                    body = _stream_upload_body(
+                        loop,
+                        cpu_executor,
+                        str(item_path),
+                        current_size,
+                        prefix,
+                        suffix,
+                        sync_progress.add_bytes,
+                    )
+                else:
+                    headers = JSON_HEADERS
+                    try:
+                        with tracing.span(
+                            "encode", path=relative_path_str, bytes=current_size
+                        ):
+                            body = await _run_cpu_stage(
+                                loop,
+                                cpu_executor,
+                                current_size,
+                                fileio.encode_upload_body,
+                                str(item_path),
+                                destination,
+                                agint_apikey,
+                            )
+                    except OSError as e:
+                        logger.error(f"Error reading file {item_path.name}: {e}")
+                        return None  # Indicate failure
 
-                        if os.getenv("DEBUG") == "1":
+                async with _hold_slot(None if large else semaphore):
+                    if DEBUG:
+                        logger.debug(
+                            f"Uploading JSON: {relative_path_str} (Semaphore acquired)"
+                        )
+                    try:
+                        with tracing.span(
+                            "upload", path=relative_path_str, bytes=current_size
+                        ):
+                            sync_progress.request_started()
+                            try:
+                                # Use a reasonable timeout for uploads
+                                upload_resp = await client.post(
+                                    sync_endpoint,
+                                    content=body,
+                                    headers=headers,
+                                    timeout=60.0,
+                                )  # Send as JSON
+                            finally:
+                                sync_progress.request_finished()
+
+                        if DEBUG:
                             logger.debug(
                                 f"Upload response status ({item_path.name}): {upload_resp.status_code}"
                             )
@@ -507,12 +1352,17 @@ def create_command_function(
                         else:
                             upload_resp.raise_for_status()  # Raise for other HTTP errors
 
-                        if os.getenv("DEBUG") == "1":
+                        if DEBUG:
                             logger.debug(
                                 f"Successfully uploaded JSON for: {item_path.name}"
                             )
-                        # Return info indicating it was uploaded
-                        return (relative_path_str, current_mtime, current_size, False)
+                        if digest is not None:
+                            store_records.append((destination, digest, current_size))
+                        cache.mark(relative_path_str, current_mtime, current_size)
+                        if current_size <= STREAM_UPLOAD_THRESHOLD:
+                            # Streamed bodies report their bytes chunk by chunk
+                            sync_progress.add_bytes(current_size)
+                        return True  # Uploaded
 
                     except httpx.HTTPStatusError as e:
                         error_body = e.response.text
@@ -537,142 +1387,593 @@ def create_command_function(
                         )
                         return None  # Indicate failure
                     finally:
-                        if os.getenv("DEBUG") == "1":
+                        if DEBUG:
                             logger.debug(
                                 f"Finished JSON upload attempt for: {relative_path_str} (Semaphore released)"
                             )
+        except Exception as e:
+            logger.error(
+                f"Error processing file {relative_path_str} for upload: {e}",
+                exc_info=True,
+            )
+            return None  # Indicate failure
+
+    async def drain(
+        lane: Iterator[Tuple[Path, os.stat_result]],
+        client: httpx.AsyncClient,
+        counts: Dict[Optional[bool], int],
+        pending_priority: Set[str],
+        priority_done: asyncio.Event,
+    ):
+        """Upload files from lane one at a time, counting each as it finishes."""
+        for item, st in lane:
+            outcome = None
+            try:
+                outcome = await upload_item(item, st, client, upload_cache)
             except Exception as e:
-                logger.error(
-                    f"Error processing file {relative_path_str} for upload: {e}",
-                    exc_info=True,
+                logger.error(f"Upload of {item} failed with exception: {e}")
+            finally:
+                counts[outcome] += 1
+                if outcome is None:
+                    sync_progress.file_failed()
+                elif outcome:
+                    sync_progress.file_done()
+                else:
+                    sync_progress.file_skipped(st.st_size)
+                if pending_priority:
+                    pending_priority.discard(str(item.relative_to(cwd)))
+                    if not pending_priority:
+                        priority_done.set()
+
+    async def main_sync():
+        async with httpx.AsyncClient() as client:
+            files = _order_uploads(_scan_workspace(cwd), cwd, priority)
+            if not files:
+                if DEBUG:
+                    logger.debug("No non-hidden files found to upload/check in CWD.")
+                if on_priority_synced is not None:
+                    on_priority_synced(set())
+                return
+            if progress.enabled:
+                sync_progress.add_total(len(files), sum(st.st_size for _, st in files))
+
+            # A fixed set of workers per lane pulls files in upload order, so
+            # earlier files get slots first and only as many files are in
+            # flight as the lane has slots, however large the workspace
+            counts: Dict[Optional[bool], int] = {True: 0, False: 0, None: 0}
+            pending_priority = {
+                str(item.relative_to(cwd)) for item, _ in files if priority
+            } & priority
+            priority_done = asyncio.Event()
+            if not pending_priority:
+                priority_done.set()
+            # Large files have their own lane, so they progress next to the
+            # small files ordered ahead of them rather than queue behind them
+            lanes = (
+                (
+                    (f for f in files if not _is_large_upload(f[1].st_size)),
+                    UPLOAD_CONCURRENCY + cpu_workers,
+                ),
+                (
+                    (f for f in files if _is_large_upload(f[1].st_size)),
+                    LARGE_UPLOAD_CONCURRENCY,
+                ),
+            )
+            workers = [
+                asyncio.create_task(
+                    drain(lane, client, counts, pending_priority, priority_done)
                 )
-                return None  # Indicate failure
-
-        async def main_sync():
-            tasks = []
-            async with httpx.AsyncClient() as client:
-                for item in cwd.rglob("*"):
-                    # Check if any part of the path starts with '.'
-                    is_hidden = any(
-                        part.startswith(".") for part in item.relative_to(cwd).parts
-                    )
-                    # Also skip the cache file itself
-                    is_cache_file = item.resolve() == _upload_cache_file.resolve()
-
-                    if is_hidden or is_cache_file:
-                        if (
-                            os.getenv("DEBUG") == "1" and not is_cache_file
-                        ):  # Don't log skipping cache file every time
-                            logger.debug(f"Skipping hidden item: {item}")
-                        continue
-
-                    if item.is_file():
-                        # Pass the loaded cache to the upload_item task
-                        tasks.append(
-                            asyncio.create_task(upload_item(item, client, upload_cache))
-                        )
-                    elif item.is_dir():
-                        if os.getenv("DEBUG") == "1":
-                            logger.debug(
-                                f"Skipping directory (upload not implemented): {item}"
-                            )
+                for lane, size in lanes
+                for _ in range(size)
+            ]
+            if DEBUG:
+                logger.debug(
+                    f"Started {len(workers)} upload workers for {len(files)} files."
+                )
+            if on_priority_synced is not None:
+                await priority_done.wait()
+                on_priority_synced({path for path in priority if path in upload_cache})
+            await asyncio.gather(*workers)
 
-                if tasks:
-                    if os.getenv("DEBUG") == "1":
-                        logger.debug(
-                            f"Gathered {len(tasks)} upload/check tasks. Running..."
-                        )
-                    # Wait for all tasks to complete
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                    # Process results to build the new cache
-                    uploaded_count = 0
-                    skipped_count = 0
-                    failed_count = 0
-                    for i, result in enumerate(results):
-                        if isinstance(result, Exception):
-                            logger.error(
-                                f"Task {i} (file check/upload) failed with exception: {result}"
-                            )
-                            failed_count += 1
-                        elif result is None:
-                            # Error already logged within upload_item
-                            logger.error(
-                                f"Task {i} (file check/upload) reported failure."
-                            )
-                            failed_count += 1
-                        elif isinstance(result, tuple):
-                            # result = (relative_path_str, current_mtime, current_size, was_skipped)
-                            rel_path, mtime, size, skipped = result
-                            # Add entry to the new cache regardless of skipped or uploaded
-                            new_upload_cache[rel_path] = {"mtime": mtime, "size": size}
-                            if skipped:
-                                skipped_count += 1
-                            else:
-                                uploaded_count += 1
-                        else:
-                            logger.error(
-                                f"Task {i} returned unexpected result type: {type(result)}"
-                            )
-                            failed_count += 1
+            if DEBUG:
+                logger.debug(
+                    f"Upload tasks finished. Uploaded: {counts[True]}, Skipped (cached): {counts[False]}, Failed: {counts[None]}"
+                )
 
-                    if os.getenv("DEBUG") == "1":
-                        logger.debug(
-                            f"Upload tasks finished. Uploaded: {uploaded_count}, Skipped (cached): {skipped_count}, Failed: {failed_count}"
-                        )
-                    # Potentially raise an error here if failed_count > 0 ? For now, just log.
+    try:
+        if DEBUG:
+            logger.debug("Starting upstream sync (with caching)...")
+        with tracing.span("sync.upstream"), sync_progress:
+            loop.run_until_complete(main_sync())
 
-                else:
-                    if os.getenv("DEBUG") == "1":
-                        logger.debug(
-                            "No non-hidden files found to upload/check in CWD."
-                        )
+        # Save the updated cache after sync completes
+        _save_upload_cache(upload_cache, api_url)
+        if store is not None:
+            store.record_uploads(volume, store_records)
+            store.collect_garbage()
+
+        if DEBUG:
+            logger.debug("Upstream sync finished.")
+    except Exception as e:
+        logger.error(f"Error during upstream sync execution: {e}", exc_info=True)
+        typer.secho(
+            "Warning: Upstream sync failed. Proceeding with command execution...",
+            fg=typer.colors.YELLOW,
+            err=True,
+        )
+    finally:
+        loop.close()
+        cpu_executor.shutdown(wait=True)
+        if store is not None:
+            store.close()
+        if DEBUG:
+            logger.debug("Closed upstream sync event loop.")
 
-        try:
-            if os.getenv("DEBUG") == "1":
-                logger.debug("Starting upstream sync (with caching)...")
-            loop.run_until_complete(main_sync())
+    return upload_cache
 
-            # Save the updated cache after sync completes
-            _save_upload_cache(new_upload_cache)
 
-            if os.getenv("DEBUG") == "1":
-                logger.debug("Upstream sync finished.")
-        except Exception as e:
-            logger.error(f"Error during upstream sync execution: {e}", exc_info=True)
-            typer.secho(
-                "Warning: Upstream sync failed. Proceeding with command execution...",
-                fg=typer.colors.YELLOW,
-                err=True,
+class _OverlappedUpstreamSync:
+    """
+    Runs the upstream sync in a background thread with the files a command
+    references uploaded first. wait_for_referenced() returns as soon as those
+    have landed, so the command request overlaps the rest of the sync.
+    """
+
+    def __init__(self, api_url: str, agint_apikey: str, referenced: Set[str]):
+        self.synced_files: Container[str] = set()
+        self._referenced_synced: Set[str] = set()
+        self._error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        # Copy the context so sync spans nest under the command span
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(
+            target=context.run,
+            args=(self._run, api_url, agint_apikey, referenced),
+            name="agi-upstream-sync",
+        )
+
+    def start(self) -> "_OverlappedUpstreamSync":
+        self._thread.start()
+        return self
+
+    def _run(self, api_url: str, agint_apikey: str, referenced: Set[str]):
+        try:
+            self.synced_files = _perform_upstream_sync(
+                api_url, agint_apikey, referenced, self._on_referenced_synced
             )
+        except BaseException as e:
+            self._error = e
         finally:
-            loop.close()
-            if os.getenv("DEBUG") == "1":
-                logger.debug("Closed upstream sync event loop.")
+            self._ready.set()
+
+    def _on_referenced_synced(self, synced: Set[str]):
+        self._referenced_synced = synced
+        self._ready.set()
+
+    def wait_for_referenced(self) -> Set[str]:
+        """Block until the referenced files are synced; returns those present."""
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self._referenced_synced
+
+    def join(self) -> Container[str]:
+        """Wait for the whole sync; returns every file present on the volume."""
+        self._thread.join()
+        return self.synced_files
+
+
+def _referenced_workspace_files(
+    kwargs: Dict[str, Any], file_params: Set[str]
+) -> Set[str]:
+    """Relative paths of CWD files passed to file-typed parameters."""
+    cwd = Path.cwd()
+    referenced = set()
+    for name in file_params:
+        value = kwargs.get(name)
+        if not isinstance(value, str) or not os.path.isfile(value):
+            continue
+        try:
+            referenced.add(str(Path(os.path.abspath(value)).relative_to(cwd)))
+        except ValueError:
+            continue
+    return referenced
+
+
+# @traceable
+def plan_upstream_sync(
+    api_url: str, agint_apikey: Optional[str] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Work out which files an upstream sync would upload or skip, using the same
+    scan, cache and shared store rules as the real sync, without sending any
+    data. The store is only consulted when agint_apikey identifies the volume.
+    """
+    cwd = Path.cwd()
+    upload_cache = _load_upload_cache(api_url)
+    store = ObjectStore.open_default() if agint_apikey else None
+    volume = volume_key(api_url, agint_apikey) if agint_apikey else ""
+    plan: Dict[str, List[Dict[str, Any]]] = {"upload": [], "skip": []}
+    try:
+        for item, st in _order_uploads(_scan_workspace(cwd), cwd, set()):
+            relative_path_str = str(item.relative_to(cwd))
+            skipped = upload_cache.is_current(
+                relative_path_str, st.st_mtime, st.st_size
+            )
+            if not skipped and store is not None:
+                # Cache misses are hashed, as the real sync does
+                try:
+                    digest = fileio.sha256_file(str(item))
+                except OSError:
+                    digest = None
+                skipped = digest is not None and store.has_upload(
+                    volume, f"{VOLUME_PREFIX}{relative_path_str}", digest
+                )
+            plan["skip" if skipped else "upload"].append(
+                {"path": relative_path_str, "size": st.st_size}
+            )
+    finally:
+        if store is not None:
+            store.close()
+    return plan
+
+
+# @traceable
+def plan_downstream_sync(
+    api_url: str, agint_apikey: str, directories: Optional[List[str]] = None
+) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """
+    List the volume directories (the whole volume when directories is None)
+    and work out which files a fan-out download would fetch or skip, comparing
+    sizes and hashes with the local copies as the real download does. Returns
+    None when the server cannot list directories.
+    """
+    if not (_spec_cache and LIST_DIRECTORY_PATH in _spec_cache.get("paths", {})):
+        return None
+    cwd = Path.cwd()
+    plan: Dict[str, List[Dict[str, Any]]] = {"download": [], "skip": []}
+    with httpx.Client(timeout=180.0, follow_redirects=True) as client:
+        for directory in directories or [""]:
+            resp = client.post(
+                f"{api_url}{LIST_DIRECTORY_PATH}",
+                json=_list_directory_payload(agint_apikey, directory),
+            )
+            if resp.status_code in (404, 405):
+                return None
+            resp.raise_for_status()
+            entries = json.loads(resp.json().get("stdout") or "[]")
+            for entry in _wanted_remote_entries(entries, directory):
+                path = posixpath.join(directory, entry["path"])
+                digest, size = entry.get("sha256"), entry.get("size") or 0
+                try:
+                    current = (
+                        bool(digest)
+                        and (cwd / path).stat().st_size == size
+                        and fileio.sha256_file(str(cwd / path)) == digest
+                    )
+                except OSError:
+                    current = False
+                plan["skip" if current else "download"].append(
+                    {"path": path, "size": size}
+                )
+    return plan
+
+
+def estimate_transfer_seconds(
+    total_bytes: int,
+    requests: int,
+    bandwidth_mbps: float = PLAN_BANDWIDTH_MBPS,
+    latency: float = PLAN_REQUEST_LATENCY,
+    concurrency: int = UPLOAD_CONCURRENCY,
+    encoded: bool = True,
+) -> float:
+    """
+    Estimate transfer time. Uploaded file contents travel base64 encoded
+    inside JSON; downloads (encoded=False) are fetched as is.
+    """
+    wire_bytes = total_bytes * 4 / 3 if encoded else total_bytes
+    rounds = math.ceil(requests / concurrency)
+    return wire_bytes / (bandwidth_mbps * 1024 * 1024) + rounds * latency
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+def _require_agint_apikey() -> str:
+    agint_apikey = os.getenv("AGINT_APIKEY")
+    if not agint_apikey:
+        typer.secho(
+            "Error: AGINT_APIKEY environment variable not set.",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    return agint_apikey
 
-    # @traceable
-    def command_func(**kwargs):
-        """Execute the command, and potentially synchronize the user's root directory afterwards."""
-        api_url = os.getenv("DOCKER_BUILDER_API_URL", "https://api.agintai.com")
-        agint_apikey = os.getenv("AGINT_APIKEY")
 
-        if not agint_apikey:
+def _read_piped_stdin() -> str:
+    """Read piped stdin once, so a command retried on another endpoint resends it."""
+    global _piped_stdin
+    if _piped_stdin is None:
+        _piped_stdin = sys.stdin.read().strip()
+    return _piped_stdin
+
+
+class _EndpointUnavailable(Exception):
+    """The command request could not reach the endpoint, so nothing ran there."""
+
+
+def _run_on_endpoint(run: Callable[[str], None]):
+    """
+    Call run with the API URL a command should use. With several endpoints
+    configured, the least loaded healthy one is leased for the duration of the
+    command, and if run raises _EndpointUnavailable the command is retried on
+    the next one.
+    """
+    api_urls = endpoints.configured_endpoints()
+    router = (
+        endpoints.EndpointRouter.open_default(api_urls) if len(api_urls) > 1 else None
+    )
+    tried: List[str] = []
+    try:
+        while True:
+            if router is not None:
+                api_url, lease = router.acquire(exclude=tried)
+            else:
+                api_url, lease = api_urls[len(tried)], None
+            started = time.monotonic()
+            latency = None
+            try:
+                run(api_url)
+                latency = time.monotonic() - started
+                return
+            except _EndpointUnavailable as e:
+                tried.append(api_url)
+                if router is not None:
+                    router.record_failure(api_url)
+                if len(tried) == len(api_urls):
+                    typer.secho(f"Error: {e.__cause__}", fg=typer.colors.RED, err=True)
+                    raise typer.Exit(code=1)
+                typer.secho(
+                    f"Warning: {api_url} is unreachable ({e.__cause__}). "
+                    "Retrying on another endpoint...",
+                    fg=typer.colors.YELLOW,
+                    err=True,
+                )
+            finally:
+                if router is not None:
+                    router.release(lease, api_url, latency)
+    finally:
+        if router is not None:
+            router.close()
+
+
+def sync_command(
+    plan: bool = typer.Option(
+        False,
+        "--plan",
+        "--dry-run",
+        help="Show what would be uploaded, skipped or downloaded without sending data.",
+    ),
+    direction: str = typer.Option(
+        "both", "--direction", help="Which way to sync: up, down or both."
+    ),
+    bandwidth: float = typer.Option(
+        PLAN_BANDWIDTH_MBPS,
+        "--bandwidth",
+        help="Assumed bandwidth in MB/s for --plan time estimates.",
+    ),
+    as_json: bool = typer.Option(False, "--json", help="Print the plan as JSON."),
+    paths: Optional[List[str]] = typer.Option(
+        None,
+        "--path",
+        help="Download only this volume directory (repeatable). Default: whole volume.",
+    ),
+    endpoint: Optional[str] = typer.Option(
+        None,
+        "--endpoint",
+        help="API URL to sync with when DOCKER_BUILDER_API_URLS lists several. Default: the first.",
+    ),
+):
+    """
+    Synchronize the current directory with the agitransfer volume without
+    running a command. Use --plan to preview the transfer and its cost.
+    """
+    if direction not in ("up", "down", "both"):
+        typer.secho(
+            f"Error: --direction must be up, down or both (got {direction})",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        raise typer.Exit(code=2)
+    if not bandwidth > 0:
+        typer.secho(
+            f"Error: --bandwidth must be greater than 0 (got {bandwidth:g})",
+            fg=typer.colors.RED,
+            err=True,
+        )
+        raise typer.Exit(code=2)
+    sync_up = direction in ("up", "both")
+    sync_down = direction in ("down", "both")
+    directories = None
+    if paths:
+        normalized = [_normalize_volume_dir(path) for path in paths]
+        if None in normalized:
             typer.secho(
-                "Error: AGINT_APIKEY environment variable not set.",
+                "Error: --path must be a directory inside the volume",
                 fg=typer.colors.RED,
                 err=True,
             )
-            raise typer.Exit(code=1)
+            raise typer.Exit(code=2)
+        directories = _collapse_directories(normalized)
+
+    api_url = (endpoint or endpoints.configured_endpoints()[0]).rstrip("/")
+
+    if plan:
+        agint_apikey = os.getenv("AGINT_APIKEY")
+        upstream = (
+            plan_upstream_sync(api_url, agint_apikey)
+            if sync_up
+            else {"upload": [], "skip": []}
+        )
+        downstream = None
+        if sync_down and agint_apikey:
+            try:
+                downstream = plan_downstream_sync(api_url, agint_apikey, directories)
+            except (httpx.HTTPError, ValueError) as e:
+                typer.secho(
+                    f"Warning: could not list the volume ({e}); "
+                    "download size is unknown.",
+                    fg=typer.colors.YELLOW,
+                    err=True,
+                )
+        upload_bytes = sum(entry["size"] for entry in upstream["upload"])
+        skip_bytes = sum(entry["size"] for entry in upstream["skip"])
+        estimate = estimate_transfer_seconds(
+            upload_bytes, len(upstream["upload"]), bandwidth
+        )
+        report = {
+            "upload": upstream["upload"],
+            "skip": upstream["skip"],
+            "upload_bytes": upload_bytes,
+            "skip_bytes": skip_bytes,
+            "estimated_upload_seconds": estimate,
+            "bandwidth_mbps": bandwidth,
+        }
+        if downstream is not None:
+            download_bytes = sum(entry["size"] for entry in downstream["download"])
+            download_estimate = estimate_transfer_seconds(
+                download_bytes,
+                len(downstream["download"]),
+                bandwidth,
+                concurrency=_download_concurrency(),
+                encoded=False,
+            )
+            report.update(
+                download=downstream["download"],
+                download_skip=downstream["skip"],
+                download_bytes=download_bytes,
+                download_skip_bytes=sum(entry["size"] for entry in downstream["skip"]),
+                estimated_download_seconds=download_estimate,
+            )
+        else:
+            # Without a listing the zip-directory endpoint cannot be sized
+            # before the server creates the archive
+            report["download"] = (directories or "full_volume") if sync_down else None
+        if as_json:
+            typer.echo(json.dumps(report, indent=2))
+            return
+
+        for entry in upstream["upload"]:
+            typer.echo(f"  upload  {entry['path']} ({_format_size(entry['size'])})")
+        typer.echo(
+            f"Upload:   {len(upstream['upload'])} files, {_format_size(upload_bytes)}"
+        )
+        typer.echo(
+            f"Skip:     {len(upstream['skip'])} unchanged files, {_format_size(skip_bytes)}"
+        )
+        typer.echo(f"Estimated upload time: {estimate:.1f}s at {bandwidth:g} MB/s")
+        if downstream is not None:
+            for entry in downstream["download"]:
+                typer.echo(
+                    f"  download  {entry['path']} ({_format_size(entry['size'])})"
+                )
+            typer.echo(
+                f"Download: {len(downstream['download'])} files, "
+                f"{_format_size(report['download_bytes'])}"
+            )
+            typer.echo(
+                f"Skip:     {len(downstream['skip'])} unchanged files, "
+                f"{_format_size(report['download_skip_bytes'])}"
+            )
+            typer.echo(
+                f"Estimated download time: {report['estimated_download_seconds']:.1f}s "
+                f"at {bandwidth:g} MB/s"
+            )
+        elif sync_down and directories:
+            typer.echo(f"Download: {', '.join(directories)}")
+        elif sync_down:
+            typer.echo(
+                "Download: full volume (size is only known once the server zips it)"
+            )
+        return
+
+    agint_apikey = _require_agint_apikey()
+    with tracing.span("sync", direction=direction):
+        if sync_up:
+            _perform_upstream_sync(api_url, agint_apikey)
+        if sync_down:
+            with tracing.span("sync.downstream", scope=",".join(directories or ["/"])):
+                _synchronize_user_directory(api_url, agint_apikey, directories)
+
+
+# @traceable
+def create_command_function(
+    path_str: str, method: str, operation: Dict[str, Any], spec: Dict[str, Any]
+):
+    """Create a command function with dynamic parameters based on OpenAPI spec."""
+    # Determine the command group (e.g., dagify, dagent)
+    command_group = path_str.strip("/").split("/")[0]
+
+    # @traceable
+    def read_file_like(path: str) -> str:
+        """Helper to read content from files, including /dev/fd paths."""
+        try:
+            # Handle process substitution and regular files
+            if path.startswith("/dev/fd/") or os.path.exists(path):
+                try:
+                    with open(path, "r") as f:
+                        return f.read()
+                except (IOError, OSError) as e:
+                    logger.debug(f"Failed to read from {path}: {e}")
+                    return path
+            return path
+        except Exception as e:
+            logger.debug(f"Error processing path {path}: {e}")
+            return path
 
-        # Determine the command group (e.g., dagify, dagent)
-        command_group = path_str.strip("/").split("/")[0]
-        sync_required_groups = {"dagify", "dagent", "schemagin", "datagin"}
+    # @traceable
+    def command_func(**kwargs):
+        """Execute the command, and potentially synchronize the user's root directory afterwards."""
+        with tracing.span("command", path=path_str, method=method.upper()):
+            # Each attempt gets fresh kwargs; _execute_command pops from them
+            _run_on_endpoint(lambda api_url: _execute_command(api_url, **dict(kwargs)))
+
+    def _execute_command(api_url: str, **kwargs):
+        agint_apikey = _require_agint_apikey()
+
+        # Sync phases can be skipped per command, or for a whole script via env
+        skipped_phases = set(os.getenv(SKIP_SYNC_ENV, "").replace(" ", "").split(","))
+        skip_pre_sync = kwargs.pop("skip_pre_sync", False) or "pre" in skipped_phases
+        skip_post_sync = kwargs.pop("skip_post_sync", False) or "post" in skipped_phases
+
+        # Objects arrive as JSON text, inline or in a file; reject bad JSON
+        # before anything is synced
+        for name in object_params:
+            if isinstance(kwargs.get(name), str):
+                kwargs[name] = _parse_object_argument(
+                    name, read_file_like(kwargs[name])
+                )
 
         # --- BEGIN PRE-COMMAND UPSTREAM SYNC ---
-        if command_group in sync_required_groups:
+        synced_files: Container[str] = set()
+        overlapped_sync: Optional[_OverlappedUpstreamSync] = None
+        if command_group in SYNC_REQUIRED_GROUPS and not skip_pre_sync:
             try:
-                _perform_upstream_sync(api_url, agint_apikey)
-                if os.getenv("DEBUG") == "1":
+                if os.getenv(OVERLAP_SYNC_ENV) == "1":
+                    referenced = _referenced_workspace_files(kwargs, file_params)
+                    overlapped_sync = _OverlappedUpstreamSync(
+                        api_url, agint_apikey, referenced
+                    ).start()
+                    with tracing.span("sync.referenced", files=len(referenced)):
+                        synced_files = overlapped_sync.wait_for_referenced()
+                else:
+                    synced_files = _perform_upstream_sync(api_url, agint_apikey)
+                if DEBUG:
                     logger.debug("Pre-command upstream sync successful.")
             except Exception as e:
                 # Catch any unexpected error during pre-sync specifically
@@ -690,12 +1991,18 @@ def create_command_function(
         command_successful = False  # Flag to track if the main command succeeded
         original_command_url = f"{api_url}{path_str}"
 
-        # Pre-process all arguments that might be file paths
-        processed_kwargs = {
-            k: read_file_like(v) if isinstance(v, str) else v
-            for k, v in kwargs.items()
-            if v is not None
-        }
+        # Pre-process all arguments that might be file paths. File-typed
+        # parameters are passed by reference; anything else is inlined as before.
+        processed_kwargs = {}
+        for k, v in kwargs.items():
+            if v is None:
+                continue
+            if isinstance(v, str):
+                if k in file_params:
+                    v = _resolve_file_argument(v, synced_files, api_url, agint_apikey)
+                else:
+                    v = read_file_like(v)
+            processed_kwargs[k] = v
 
         # Filter out None values
         body = {k: v for k, v in processed_kwargs.items() if v is not None}
@@ -706,36 +2013,40 @@ def create_command_function(
         # Check for piped input and add to body
         if not sys.stdin.isatty():
             try:
-                stdin_data = sys.stdin.read().strip()
+                stdin_data = _read_piped_stdin()
                 body["stdin"] = stdin_data
-                if os.getenv("DEBUG") == "1":
+                if DEBUG:
                     logger.debug(f"Added stdin data (length={len(stdin_data)})")
             except Exception as e:
                 logger.error(f"Error reading from stdin: {e}")
 
         # Log request details if DEBUG=1
-        if os.getenv("DEBUG") == "1":
+        if DEBUG:
             logger.debug(f"Making {method.upper()} request to {original_command_url}")
-            logger.debug(f"Request body: {json.dumps(body, indent=2)}")
+            # Inlined file contents are shortened, never dumped whole
+            logger.debug("Request body: %s", summarize(body))
 
         try:
             # Use a longer timeout for long-running commands (3 minutes)
             with httpx.Client(timeout=180.0) as client:
-                resp = client.request(method.upper(), original_command_url, json=body)
+                with tracing.span("command.request", url=original_command_url) as span:
+                    resp = client.request(
+                        method.upper(), original_command_url, json=body
+                    )
+                    span.set("status", resp.status_code)
+                    span.set("response_bytes", len(resp.content))
 
                 # Log the raw response in debug mode
-                if os.getenv("DEBUG") == "1":
+                if DEBUG:
                     logger.debug(f"Response status: {resp.status_code}")
                     logger.debug(f"Response headers: {dict(resp.headers)}")
-                    logger.debug(f"Raw response body: {resp.text}")
+                    logger.debug("Raw response body: %s", summarize(resp.text))
 
                 # Handle 400 errors specially to extract the error message
                 if resp.status_code == 400:
                     error_data = resp.json()
-                    if os.getenv("DEBUG") == "1":
-                        logger.debug(
-                            f"Parsed error response: {json.dumps(error_data, indent=2)}"
-                        )
+                    if DEBUG:
+                        logger.debug("Parsed error response: %s", summarize(error_data))
 
                     # Extract error details
                     if isinstance(error_data, dict):
@@ -766,6 +2077,7 @@ def create_command_function(
 
                 resp.raise_for_status()
                 data = resp.json()
+                post_sync_scope = _post_sync_scope(kwargs, data)
 
                 # Always show stderr on the terminal if present
                 if data.get("stderr"):
@@ -776,7 +2088,7 @@ def create_command_function(
                         stderr_text = stderr_bytes.decode("utf-8")
 
                         # --- DEBUG: Print the representation of stderr ---
-                        # if os.getenv("DEBUG") == "1":
+                        # if DEBUG:
                         #     logger.debug(f"Raw stderr received: {repr(data['stderr'])}")
                         # --- END DEBUG ---
 
@@ -798,15 +2110,22 @@ def create_command_function(
                         print(data["stdout"], end="")
 
                 # Log response if DEBUG=1
-                if os.getenv("DEBUG") == "1":
-                    logger.debug(f"Processed response: {json.dumps(data, indent=2)}")
-
+                if DEBUG:
+                    logger.debug("Processed response: %s", summarize(data))
+
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # The request never reached the server, so it can run elsewhere
+            if overlapped_sync is not None:
+                overlapped_sync.join()
+            raise _EndpointUnavailable(api_url) from e
         except httpx.HTTPError as e:
             typer.secho(f"Error: {str(e)}", fg=typer.colors.RED, err=True)
             raise typer.Exit(code=1)
         except json.JSONDecodeError:
-            if os.getenv("DEBUG") == "1":
-                logger.debug(f"Failed to parse JSON from response: {resp.text}")
+            if DEBUG:
+                logger.debug(
+                    "Failed to parse JSON from response: %s", summarize(resp.text)
+                )
             typer.secho(
                 "Error: Invalid response format from server",
                 fg=typer.colors.RED,
@@ -819,12 +2138,27 @@ def create_command_function(
         # --- END ORIGINAL COMMAND LOGIC ---
 
         # --- BEGIN POST-COMMAND SYNC LOGIC ---
-        if command_successful and command_group in sync_required_groups:
+        if overlapped_sync is not None:
+            # Downloads must not overwrite files the sync is still reading
+            with tracing.span("sync.upstream.join"):
+                overlapped_sync.join()
+            if DEBUG:
+                logger.debug("Overlapped upstream sync finished.")
+        if (
+            command_successful
+            and command_group in SYNC_REQUIRED_GROUPS
+            and not skip_post_sync
+        ):
             try:
                 # Call the sync function which now starts the background download
-                _synchronize_user_directory(api_url, agint_apikey)
-                if os.getenv("DEBUG") == "1":
-                    logger.debug("Post-command background sync initiated.")
+                with tracing.span(
+                    "sync.downstream", scope=",".join(post_sync_scope or ["/"])
+                ):
+                    _synchronize_user_directory(api_url, agint_apikey, post_sync_scope)
+                if DEBUG:
+                    logger.debug(
+                        f"Post-command sync done for {post_sync_scope or 'whole volume'}."
+                    )
             # No longer catching typer.Exit here as the sync function doesn't raise it directly
             except Exception as e:
                 # Catch unexpected errors during the *initiation* of the background sync
@@ -835,29 +2169,70 @@ def create_command_function(
                 )
                 logger.exception("Unexpected error initiating post-command sync:")
                 # Do not exit, just log the initiation failure. Command already succeeded.
+        elif command_successful and command_group in SYNC_REQUIRED_GROUPS:
+            # Nothing confirms what the command wrote, so stop trusting the
+            # shared store there
+            _forget_volume_uploads(api_url, agint_apikey, post_sync_scope)
 
         # --- END POST-COMMAND SYNC LOGIC ---
 
-    # Extract request body schema
-    body_schema = extract_body_schema(operation, spec)
-    properties = body_schema.get("properties", {})
+    # Resolved request body properties, cached per operation
+    descriptors = get_schema_resolver(spec).describe_parameters(operation)
 
     # Build dynamic parameters
     parameters = []
-    for prop_name, prop_spec in properties.items():
+    file_params = {
+        descriptor["name"]
+        for descriptor in descriptors
+        if is_file_parameter(descriptor["spec"])
+    }
+    object_params = {
+        descriptor["name"]
+        for descriptor in descriptors
+        if schema_type(descriptor["spec"]) == "object"
+    }
+    for descriptor in descriptors:
+        prop_name = descriptor["name"]
         if (
             prop_name != "agint_apikey" and prop_name != "stdin"
         ):  # Skip agint_apikey as it's handled automatically
-            param_obj = create_parameter(prop_name, prop_spec)
+            param_obj = create_parameter(prop_name, descriptor["spec"])
             parameters.append(
                 inspect.Parameter(
                     prop_name,
                     kind=inspect.Parameter.KEYWORD_ONLY,
                     default=param_obj,
-                    annotation=TYPE_MAP.get(prop_spec.get("type", "string"), str),
+                    annotation=descriptor["annotation"],
                 )
             )
 
+    # Commands that sync the CWD can opt out of either sync phase
+    if command_group in SYNC_REQUIRED_GROUPS:
+        parameters.append(
+            inspect.Parameter(
+                "skip_pre_sync",
+                kind=inspect.Parameter.KEYWORD_ONLY,
+                default=typer.Option(
+                    False,
+                    "--skip-pre-sync",
+                    help="Do not upload local changes before running the command.",
+                ),
+                annotation=bool,
+            )
+        )
+        parameters.append(
+            inspect.Parameter(
+                "skip_post_sync",
+                kind=inspect.Parameter.KEYWORD_ONLY,
+                default=typer.Option(
+                    False,
+                    "--skip-post-sync",
+                    help="Do not download the volume after the command finishes.",
+                ),
+                annotation=bool,
+            )
+        )
+
     # Set the signature and return the function
     command_func.__signature__ = inspect.Signature(parameters=parameters)
     command_func.__doc__ = operation.get("description", "")
@@ -871,19 +2246,7 @@ def extract_body_schema(
     """
     Extract the requestBody schema from the operation, resolving any references.
     """
-    req_body = operation.get("requestBody", {})
-    content = req_body.get("content", {})
-    schema = content.get("application/json", {}).get("schema", {})
-
-    # If it's a reference, resolve it
-    if "$ref" in schema:
-        ref_path = schema["$ref"].split("/")
-        current = spec
-        for part in ref_path[1:]:  # Skip the first '#'
-            current = current.get(part, {})
-        schema = current
-
-    return schema if isinstance(schema, dict) else {}
+    return get_schema_resolver(spec).body_schema(operation)
 
 
 # @traceable
@@ -937,8 +2300,16 @@ def create_cli_apps():
 
     # Create apps for each group
     apps = {}
-    for group_name, group_paths in groups.items():
-        apps[group_name] = create_app_for_group(group_name, group_paths, spec)
+    with tracing.span("commands.build", groups=len(groups)):
+        for group_name, group_paths in groups.items():
+            apps[group_name] = create_app_for_group(group_name, group_paths, spec)
+
+    # Sync-only entry point, independent of the server's agitransfer commands
+    if "agitransfer" not in apps:
+        apps["agitransfer"] = typer.Typer(
+            help="CLI for agitransfer", no_args_is_help=True
+        )
+    apps["agitransfer"].command(name="sync")(sync_command)
 
     return apps
 
@@ -969,27 +2340,9 @@ def main():
         app()
 
 
-# @traceable
-def clean_formatted_text(text: str) -> str:
-    """Clean up RTF/formatted text to make it more readable.
-
-    Args:
-        text: The text to clean up
-
-    Returns:
-        Cleaned up text with RTF/formatting removed
-    """
-    if not isinstance(text, str):
-        return str(text)
-
-    # Remove common RTF/ANSI escape sequences
-    import re
-
-    # Remove ANSI escape sequences
-    text = re.sub(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])", "", text)
-
-    # Remove box drawing characters with simpler alternatives
-    box_chars_map = {
+# Box drawing characters and their ASCII stand-ins
+BOX_CHARS_MAP = tuple(
+    {
         "─": "-",
         "│": "|",
         "╭": "+",
@@ -1010,24 +2363,77 @@ def clean_formatted_text(text: str) -> str:
         "┳": "+",
         "┻": "+",
         "╋": "+",
-    }
-    for old, new in box_chars_map.items():
-        text = text.replace(old, new)
+    }.items()
+)
+ANSI_ESCAPE_RE = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+RTF_GROUP_RE = re.compile(r"\{\\[^}]+\}")
+STYLE_CODE_RE = re.compile(r"\[[012]m")
+
+
+# @traceable
+def clean_formatted_text(text: str) -> str:
+    """Clean up RTF/formatted text to make it more readable.
 
-    # Remove other common formatting artifacts
-    text = re.sub(r"\{\\[^}]+\}", "", text)
+    Args:
+        text: The text to clean up
+
+    Returns:
+        Cleaned up text with RTF/formatting removed
+    """
+    if not isinstance(text, str):
+        return str(text)
 
-    # Clean up common command-line formatting
-    text = re.sub(r"\[0m|\[1m|\[2m", "", text)
+    # Each pass is skipped when its marker is absent, which is the common case
+    if "\x1b" in text:
+        text = ANSI_ESCAPE_RE.sub("", text)
+    # str.replace scans with memchr; str.translate is far slower on non-ASCII text
+    if not text.isascii():
+        for old, new in BOX_CHARS_MAP:
+            if old in text:
+                text = text.replace(old, new)
+    if "{\\" in text:
+        text = RTF_GROUP_RE.sub("", text)
+    if "[" in text:
+        text = STYLE_CODE_RE.sub("", text)
 
-    # Normalize whitespace while preserving line breaks
-    lines = text.split("\n")
-    lines = [re.sub(r"\s+", " ", line).strip() for line in lines]
-    text = "\n".join(line for line in lines if line)
+    # Normalize whitespace while preserving line breaks; split() collapses the
+    # same characters as \s+ and strips the ends in one step
+    lines = (" ".join(line.split()) for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
 
-    return text
+
+def iter_clean_formatted_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Clean output incrementally, yielding each non-empty line once complete.
+
+    Args:
+        chunks: Text as it arrives, split at arbitrary points
+
+    Yields:
+        Cleaned lines, without line breaks. The rules match
+        clean_formatted_text, applied per line, so an RTF group that spans
+        lines is left in place.
+    """
+    pending: List[str] = []
+    for chunk in chunks:
+        end = chunk.rfind("\n")
+        if end == -1:
+            pending.append(chunk)
+            continue
+        pending.append(chunk[:end])
+        batch = "".join(pending)
+        pending = [chunk[end + 1 :]]
+        if "{" in batch and "\\" in batch:
+            # An RTF group could match across lines of the batch, so clean
+            # each line on its own; no other rule crosses a line break
+            lines = [clean_formatted_text(line) for line in batch.split("\n")]
+        else:
+            lines = clean_formatted_text(batch).split("\n")
+        yield from (line for line in lines if line)
+    cleaned = clean_formatted_text("".join(pending))
+    if cleaned:
+        yield cleaned
 
 
 if __name__ == "__main__":
-    load_dotenv()   
+    load_dotenv()
     main()
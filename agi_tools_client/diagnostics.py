@@ -0,0 +1,97 @@
+"""
+Debug logging for the CLI.
+
+DEBUG=1 turns on debug logging. The variable is read once, when this module
+is imported, into the `DEBUG` constant, and hot paths test that constant
+instead of the environment; debug-only work goes inside `if DEBUG:` blocks.
+
+Request and response payloads can carry whole file contents, so they are
+never dumped as is. `summarize()` wraps a payload in an object that is only
+rendered if the log record is actually emitted, and the rendering shortens
+every long string and list and caps the whole message:
+
+    logger.debug("Request body: %s", summarize(body))
+
+    AGI_DEBUG_MAX_CHARS=<n>    longest string kept in a payload (default 200)
+    AGI_DEBUG_MAX_ITEMS=<n>    list items kept in a payload (default 20)
+    AGI_DEBUG_MAX_MESSAGE=<n>  longest rendered payload (default 8000)
+"""
+
+import json
+import logging
+import os
+from typing import Any
+
+DEBUG = os.getenv("DEBUG") == "1"
+
+MAX_CHARS_ENV = "AGI_DEBUG_MAX_CHARS"
+MAX_ITEMS_ENV = "AGI_DEBUG_MAX_ITEMS"
+MAX_MESSAGE_ENV = "AGI_DEBUG_MAX_MESSAGE"
+
+
+def _limit(name: str, default: int) -> int:
+    try:
+        return max(int(os.getenv(name, default)), 1)
+    except ValueError:
+        return default
+
+
+MAX_CHARS = _limit(MAX_CHARS_ENV, 200)
+MAX_ITEMS = _limit(MAX_ITEMS_ENV, 20)
+MAX_MESSAGE = _limit(MAX_MESSAGE_ENV, 8000)
+
+
+def configure_logging():
+    """Set up the root logger for the CLI; debug level only when DEBUG=1."""
+    # Suppress HTTPX request logs
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.basicConfig(
+        level=logging.DEBUG if DEBUG else logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... <{len(text)} chars>"
+
+
+def _shorten(value: Any) -> Any:
+    """Copy a JSON-like value with long strings and lists cut down."""
+    if isinstance(value, str):
+        return _truncate(value, MAX_CHARS)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, dict):
+        return {str(key): _shorten(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shortened = [_shorten(item) for item in value[:MAX_ITEMS]]
+        if len(value) > MAX_ITEMS:
+            shortened.append(f"... <{len(value) - MAX_ITEMS} more items>")
+        return shortened
+    return value
+
+
+class _Summary:
+    """A payload rendered for the log only when it is formatted."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            text = json.dumps(_shorten(self.value), indent=2, default=repr)
+        return _truncate(text, MAX_MESSAGE)
+
+
+def summarize(value: Any) -> _Summary:
+    """
+    Wrap a request or response payload (a JSON-like value or text) for
+    logging with %s; it is shortened and rendered only if emitted.
+    """
+    return _Summary(value)
@@ -0,0 +1,207 @@
+"""
+Routing commands across several API endpoints.
+
+DOCKER_BUILDER_API_URLS lists endpoints, comma-separated. When it is unset,
+the single DOCKER_BUILDER_API_URL is used and no routing happens. Every
+endpoint has its own volume, so a command runs its pre-sync, request and
+post-sync against one endpoint, and the workspace keeps separate sync state
+for each.
+
+Independent commands, usually separate CLI processes started by a batch
+script, are spread by load. A process holds a lease on its endpoint in a
+host-wide SQLite table while its command runs. A new command picks the
+healthy endpoint with the lowest (leases + 1) x average command latency.
+An endpoint that cannot be reached is benched for a cool-down that doubles
+with each consecutive failure, and commands fail over to the next one.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Collection, List, Optional, Tuple
+
+from agi_tools_client.store import default_store_dir
+
+logger = logging.getLogger(__name__)
+
+API_URL_ENV = "DOCKER_BUILDER_API_URL"
+API_URLS_ENV = "DOCKER_BUILDER_API_URLS"
+DEFAULT_API_URL = "https://api.agintai.com"
+# Weight of the newest sample in the average command latency
+LATENCY_SMOOTHING = 0.3
+BENCH_SECONDS = 30.0
+MAX_BENCH_SECONDS = 600.0
+# Leases of processes that died without releasing them expire after this
+LEASE_TTL = 900.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS endpoint_health (
+    url TEXT PRIMARY KEY,
+    latency REAL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    benched_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS endpoint_leases (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    started REAL NOT NULL
+);
+"""
+
+
+def configured_endpoints() -> List[str]:
+    """The endpoints to use, in configured order; never empty."""
+    urls = [
+        url.strip().rstrip("/")
+        for url in os.getenv(API_URLS_ENV, "").split(",")
+        if url.strip()
+    ]
+    return list(dict.fromkeys(urls)) or [os.getenv(API_URL_ENV, DEFAULT_API_URL)]
+
+
+def is_multi_endpoint() -> bool:
+    return len(configured_endpoints()) > 1
+
+
+class EndpointRouter:
+    """Host-wide load and health bookkeeping for a set of endpoints."""
+
+    def __init__(self, endpoints: List[str], path: Path):
+        self.endpoints = endpoints
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @classmethod
+    def open_default(cls, endpoints: List[str]) -> Optional["EndpointRouter"]:
+        """Open the host routing table, or return None if it is unusable."""
+        try:
+            return cls(endpoints, default_store_dir() / "endpoints.db")
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Endpoint routing unavailable, using configured order: {e}")
+            return None
+
+    def ranked(self) -> List[str]:
+        """
+        Endpoints in order of preference: healthy ones by expected wait, then
+        benched ones by how soon their cool-down ends.
+        """
+        try:
+            return self._rank()
+        except sqlite3.Error as e:
+            logger.warning(f"Endpoint routing lookup failed: {e}")
+            return list(self.endpoints)
+
+    def _rank(self) -> List[str]:
+        now = time.time()
+        health = {
+            url: (latency, benched_until)
+            for url, latency, benched_until in self._conn.execute(
+                "SELECT url, latency, benched_until FROM endpoint_health"
+            )
+        }
+        leases = dict(
+            self._conn.execute(
+                "SELECT url, COUNT(*) FROM endpoint_leases "
+                "WHERE started > ? GROUP BY url",
+                (now - LEASE_TTL,),
+            ).fetchall()
+        )
+
+        known = [h[0] for h in health.values() if h[0] is not None]
+        # Endpoints without samples yet are assumed to be as fast as the best
+        default_latency = min(known) if known else 1.0
+
+        def key(item):
+            position, url = item
+            latency, benched_until = health.get(url, (None, 0.0))
+            if benched_until > now:
+                return (1, benched_until, position)
+            load = (leases.get(url, 0) + 1) * (latency or default_latency)
+            return (0, load, position)
+
+        return [url for _, url in sorted(enumerate(self.endpoints), key=key)]
+
+    def acquire(self, exclude: Collection[str] = ()) -> Tuple[str, Optional[int]]:
+        """
+        Pick the preferred endpoint not in exclude and lease it for one
+        command. Ranking and leasing share a write transaction, so commands
+        starting at the same moment see each other's choice.
+        """
+        candidates = [url for url in self.endpoints if url not in exclude]
+        try:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                self._conn.execute(
+                    "DELETE FROM endpoint_leases WHERE started <= ?",
+                    (now - LEASE_TTL,),
+                )
+                url = next(url for url in self._rank() if url not in exclude)
+                cursor = self._conn.execute(
+                    "INSERT INTO endpoint_leases (url, started) VALUES (?, ?)",
+                    (url, now),
+                )
+            return url, cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to record endpoint lease: {e}")
+            return candidates[0], None
+
+    def release(self, lease: Optional[int], url: str, latency: Optional[float]):
+        """
+        Drop a lease. A latency means the command succeeded: it is folded into
+        the endpoint's average and clears its failure count.
+        """
+        try:
+            with self._conn:
+                if lease is not None:
+                    self._conn.execute(
+                        "DELETE FROM endpoint_leases WHERE id = ?", (lease,)
+                    )
+                if latency is not None:
+                    self._ensure_row(url)
+                    self._conn.execute(
+                        "UPDATE endpoint_health SET "
+                        "latency = COALESCE(latency * ? + ? * ?, ?), "
+                        "failures = 0, benched_until = 0 WHERE url = ?",
+                        (
+                            1 - LATENCY_SMOOTHING,
+                            latency,
+                            LATENCY_SMOOTHING,
+                            latency,
+                            url,
+                        ),
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to update endpoint routing: {e}")
+
+    def record_failure(self, url: str):
+        """Bench url; the cool-down doubles with each consecutive failure."""
+        try:
+            with self._conn:
+                self._ensure_row(url)
+                self._conn.execute(
+                    "UPDATE endpoint_health SET failures = failures + 1 WHERE url = ?",
+                    (url,),
+                )
+                (failures,) = self._conn.execute(
+                    "SELECT failures FROM endpoint_health WHERE url = ?", (url,)
+                ).fetchone()
+                cooldown = min(BENCH_SECONDS * 2 ** (failures - 1), MAX_BENCH_SECONDS)
+                self._conn.execute(
+                    "UPDATE endpoint_health SET benched_until = ? WHERE url = ?",
+                    (time.time() + cooldown, url),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to update endpoint routing: {e}")
+
+    def _ensure_row(self, url: str):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO endpoint_health (url) VALUES (?)", (url,)
+        )
+
+    def close(self) -> None:
+        self._conn.close()
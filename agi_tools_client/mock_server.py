@@ -0,0 +1,498 @@
+"""
+Local stand-in for the AGI Tools API.
+
+Serves a configurable OpenAPI spec and implements the `agitransfer` endpoints
+against a local directory, so the client can be exercised without network
+access. Latency, bandwidth and error rates can be injected to reproduce slow or
+flaky links. Point the client at it with `DOCKER_BUILDER_API_URL`.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import quote, unquote
+
+import typer
+
+logger = logging.getLogger(__name__)
+
+VOLUME_PREFIX = "agitransfer://"
+DOWNLOAD_PREFIX = "/_mock/downloads/"
+FILES_PREFIX = "/_mock/files/"
+CHUNK_SIZE = 64 * 1024
+
+
+def _property(
+    description: str,
+    type_: str = "string",
+    default: Any = None,
+    format: Optional[str] = None,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """Build a request-body property in the shape the AGI Tools API emits."""
+    prop = {"type": type_, "description": description, "openapi_extra": extra}
+    if default is not None:
+        prop["default"] = default
+    if format is not None:
+        prop["format"] = format
+    return prop
+
+
+def _command(description: str, **properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a POST operation with an inline JSON request body."""
+    properties.setdefault("agint_apikey", _property("API key"))
+    return {
+        "post": {
+            "description": description,
+            "requestBody": {
+                "content": {
+                    "application/json": {
+                        "schema": {"type": "object", "properties": properties}
+                    }
+                }
+            },
+        }
+    }
+
+
+def default_spec() -> Dict[str, Any]:
+    """A small spec covering every command group the client exports."""
+    prompt = _property("Prompt", **{"x-is-argument": True, "x-required": True})
+    data = _property(
+        "Input file or JSON string", format="path", **{"x-is-argument": True}
+    )
+    output_dir = _property("Directory to save outputs", **{"x-cli-name": "output_dir"})
+    verbose = _property(
+        "Enable verbose output", "boolean", False, **{"x-is-flag": True}
+    )
+    return {
+        "openapi": "3.1.0",
+        "info": {"title": "AGI Tools (mock)", "version": "0.0.0"},
+        "paths": {
+            "/health": {"get": {"description": "Health check"}},
+            "/dagify/compose": _command(
+                "Creates a new workflow from a description.",
+                prompt=prompt,
+                data=data,
+                output_dir=output_dir,
+                verbose=verbose,
+            ),
+            "/dagify/compile": _command(
+                "Compiles a DAG into an executable format.",
+                data=data,
+                output_dir=output_dir,
+                verbose=verbose,
+            ),
+            "/dagent/execute": _command(
+                "Execute a DAG plan.",
+                plan=_property("DAG plan", format="path", **{"x-is-argument": True}),
+                data=data,
+                output_dir=output_dir,
+                verbose=verbose,
+            ),
+            "/schemagin/visualize": _command(
+                "Render schema diagrams.",
+                schema=_property(
+                    "Schema file",
+                    format="path",
+                    **{"x-is-argument": True, "x-required": True},
+                ),
+                output_dir=output_dir,
+                verbose=verbose,
+            ),
+            "/datagin/ingest": _command(
+                "Extract and structure data from an input source.",
+                prompt=prompt,
+                input=_property(
+                    "Input file",
+                    format="path",
+                    **{"x-is-argument": True, "x-required": True},
+                ),
+                output_dir=output_dir,
+            ),
+            "/agitransfer/upload-file": _command(
+                "Upload a base64 encoded file to the volume.",
+                destination=_property("Destination URI", **{"x-required": True}),
+                source=_property("Base64 file content", **{"x-required": True}),
+            ),
+            "/agitransfer/zip-directory": _command(
+                "Zip a volume directory and return a download URL.",
+                directory_path=_property("Directory URI", **{"x-required": True}),
+                verbose=verbose,
+            ),
+            "/agitransfer/list-directory": _command(
+                "List the files under a volume directory with download URLs.",
+                directory_path=_property("Directory URI", **{"x-required": True}),
+            ),
+        },
+    }
+
+
+class MockServer:
+    """
+    Threaded HTTP server backed by a local volume directory.
+
+    Use as a context manager, or call start()/stop() explicitly. `url` is the
+    value to export as DOCKER_BUILDER_API_URL.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        spec: Optional[Dict[str, Any]] = None,
+        latency: float = 0.0,
+        bandwidth: Optional[float] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+        per_connection: bool = False,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.spec = spec if spec is not None else default_spec()
+        self.latency = latency
+        self.bandwidth = bandwidth  # bytes per second, None for unlimited
+        # By default all connections share one link of that bandwidth
+        self.per_connection = per_connection
+        self.error_rate = error_rate
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "errors_injected": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+        }
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Token bucket of the shared link, as the time its tokens are refilled
+        self._link_lock = threading.Lock()
+        self._link_free_at = 0.0
+        self._downloads_dir = Path(tempfile.mkdtemp(prefix="agi-mock-downloads-"))
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="agi-mock-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        if self._thread:
+            self._thread.join()
+        self.close()
+
+    def close(self):
+        self._httpd.server_close()
+        shutil.rmtree(self._downloads_dir, ignore_errors=True)
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def volume_path(self, uri: str) -> Path:
+        """Map an agitransfer:// URI onto the volume root, refusing escapes."""
+        relative = uri[len(VOLUME_PREFIX) :] if uri.startswith(VOLUME_PREFIX) else uri
+        path = (self.root / relative.lstrip("/")).resolve()
+        root = self.root.resolve()
+        if path != root and root not in path.parents:
+            raise ValueError(f"Path escapes volume root: {uri}")
+        return path
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.stats["errors_injected"] += 1
+        return failed
+
+    def throttle(self, nbytes: int):
+        """Wait until nbytes may pass the link (or this connection's share)."""
+        if not self.bandwidth:
+            return
+        cost = nbytes / self.bandwidth
+        if self.per_connection:
+            time.sleep(cost)
+            return
+        with self._link_lock:
+            now = time.monotonic()
+            # An idle link banks at most one chunk's worth of tokens
+            start = max(self._link_free_at, now - CHUNK_SIZE / self.bandwidth)
+            self._link_free_at = wake = start + cost
+        if wake > now:
+            time.sleep(wake - now)
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections (1s SYN retries) once the
+    # client opens its full set of concurrent uploads
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def mock(self) -> MockServer:
+        return self.server.mock
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _read_body(self) -> bytes:
+        remaining = int(self.headers.get("Content-Length") or 0)
+        chunks = []
+        while remaining > 0:
+            chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            self.mock.throttle(len(chunk))
+            chunks.append(chunk)
+        body = b"".join(chunks)
+        self.mock.count("bytes_in", len(body))
+        return body
+
+    def _send_bytes(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for offset in range(0, len(body), CHUNK_SIZE):
+            chunk = body[offset : offset + CHUNK_SIZE]
+            self.mock.throttle(len(chunk))
+            self.wfile.write(chunk)
+        self.mock.count("bytes_out", len(body))
+
+    def _send_json(self, status: int, data: Any):
+        self._send_bytes(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def _send_result(
+        self,
+        stdout: str = "",
+        stderr: str = "",
+        status: int = 200,
+        artifacts: Optional[list] = None,
+    ):
+        result = {
+            "stdout": stdout,
+            "stderr": base64.b64encode(stderr.encode("utf-8")).decode("ascii"),
+            "exit_code": 0 if status == 200 else 1,
+        }
+        if artifacts:
+            # Volume URIs of the files the command wrote
+            result["artifacts"] = artifacts
+        self._send_json(status, result)
+
+    def _begin(self) -> bool:
+        """Apply injected latency and errors; returns False if the request failed."""
+        self.mock.count("requests")
+        if self.mock.latency:
+            time.sleep(self.mock.latency)
+        if self.path != "/openapi.json" and self.mock.should_fail():
+            self._read_body()
+            self._send_json(503, {"detail": "Injected failure"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._begin():
+            return
+        if self.path == "/openapi.json":
+            self._send_json(200, self.mock.spec)
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path.startswith(DOWNLOAD_PREFIX):
+            name = Path(self.path[len(DOWNLOAD_PREFIX) :]).name
+            archive = self.mock._downloads_dir / name
+            if not archive.is_file():
+                self._send_json(404, {"detail": "Not found"})
+                return
+            body = archive.read_bytes()
+            archive.unlink()
+            self._send_bytes(200, body, "application/zip")
+        elif self.path.startswith(FILES_PREFIX):
+            try:
+                path = self.mock.volume_path(unquote(self.path[len(FILES_PREFIX) :]))
+            except ValueError:
+                path = None
+            if path is None or not path.is_file():
+                self._send_json(404, {"detail": "Not found"})
+                return
+            self._send_bytes(200, path.read_bytes(), "application/octet-stream")
+        else:
+            self._send_json(404, {"detail": "Not found"})
+
+    def do_POST(self):
+        if not self._begin():
+            return
+        try:
+            payload = json.loads(self._read_body() or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(422, {"detail": "Invalid JSON body"})
+            return
+
+        handlers = {
+            "/agitransfer/upload-file": self._upload_file,
+            "/agitransfer/zip-directory": self._zip_directory,
+            "/agitransfer/list-directory": self._list_directory,
+        }
+        handler = handlers.get(self.path)
+        try:
+            if handler:
+                handler(payload)
+            elif self.path in self.mock.spec.get("paths", {}):
+                self._run_command(payload)
+            else:
+                self._send_json(404, {"detail": "Not found"})
+        except ValueError as e:
+            self._send_result(stderr=str(e), status=400)
+
+    def _upload_file(self, payload: Dict[str, Any]):
+        target = self.mock.volume_path(payload.get("destination", ""))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(base64.b64decode(payload.get("source", "")))
+        self._send_result(stdout=f"Uploaded {payload.get('destination')}")
+
+    def _zip_directory(self, payload: Dict[str, Any]):
+        directory = self.mock.volume_path(payload.get("directory_path", VOLUME_PREFIX))
+        if not directory.is_dir():
+            raise ValueError(f"Directory not found: {payload.get('directory_path')}")
+
+        name = f"{uuid.uuid4().hex}.zip"
+        with zipfile.ZipFile(self.mock._downloads_dir / name, "w") as archive:
+            for path in sorted(directory.rglob("*")):
+                if path.is_file():
+                    archive.write(path, path.relative_to(directory).as_posix())
+        self._send_result(stdout=f"{self.mock.url}{DOWNLOAD_PREFIX}{name}")
+
+    def _list_directory(self, payload: Dict[str, Any]):
+        directory = self.mock.volume_path(payload.get("directory_path", VOLUME_PREFIX))
+        if not directory.is_dir():
+            raise ValueError(f"Directory not found: {payload.get('directory_path')}")
+
+        root = self.mock.root.resolve()
+        entries = []
+        for path in sorted(directory.rglob("*")):
+            if path.is_file():
+                data = path.read_bytes()
+                entries.append(
+                    {
+                        "path": path.relative_to(directory).as_posix(),
+                        "size": len(data),
+                        "sha256": hashlib.sha256(data).hexdigest(),
+                        "url": f"{self.mock.url}{FILES_PREFIX}"
+                        + quote(path.resolve().relative_to(root).as_posix()),
+                    }
+                )
+        self._send_result(stdout=json.dumps(entries))
+
+    def _run_command(self, payload: Dict[str, Any]):
+        """Echo the request and drop a small artifact into --output-dir, if given."""
+        request = {
+            k: v for k, v in payload.items() if k not in ("agint_apikey", "stdin")
+        }
+        command = self.path.strip("/").replace("/", "-")
+        output_dir = payload.get("output_dir")
+        artifacts = []
+        if output_dir and not os.path.isabs(output_dir):
+            target = self.mock.volume_path(output_dir) / f"{command}.json"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(json.dumps(request, indent=2))
+            relative = target.relative_to(self.mock.root.resolve()).as_posix()
+            artifacts.append(f"{VOLUME_PREFIX}{relative}")
+        self._send_result(
+            stdout=json.dumps({"command": command, "request": request}) + "\n",
+            artifacts=artifacts,
+        )
+
+
+def main(
+    root: Path = typer.Option(
+        Path("./mock_volume"), "--root", help="Directory backing the agitransfer volume"
+    ),
+    host: str = typer.Option("127.0.0.1", "--host", help="Interface to bind"),
+    port: int = typer.Option(8765, "--port", help="Port to listen on (0 for any)"),
+    spec: Optional[Path] = typer.Option(
+        None,
+        "--spec",
+        help="OpenAPI spec JSON file to serve instead of the built-in one",
+    ),
+    latency: float = typer.Option(
+        0.0, "--latency", help="Added latency per request, in seconds"
+    ),
+    bandwidth: Optional[float] = typer.Option(
+        None,
+        "--bandwidth",
+        help="Bandwidth limit shared by all connections, in bytes per second",
+    ),
+    per_connection: bool = typer.Option(
+        False,
+        "--per-connection",
+        help="Apply --bandwidth to each connection instead of in aggregate",
+    ),
+    error_rate: float = typer.Option(
+        0.0, "--error-rate", help="Fraction of requests answered with HTTP 503"
+    ),
+    seed: Optional[int] = typer.Option(None, "--seed", help="Seed for injected errors"),
+):
+    """Run a local stand-in AGI Tools server."""
+    server = MockServer(
+        root,
+        host=host,
+        port=port,
+        spec=json.loads(spec.read_text()) if spec else None,
+        latency=latency,
+        bandwidth=bandwidth,
+        error_rate=error_rate,
+        seed=seed,
+        per_connection=per_connection,
+    )
+    typer.echo(f"export DOCKER_BUILDER_API_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def run():
+    """Console script entry point."""
+    typer.run(main)
+
+
+if __name__ == "__main__":
+    run()
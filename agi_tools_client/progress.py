@@ -0,0 +1,302 @@
+"""
+Live progress for sync transfers.
+
+Progress is configured once from the environment:
+
+    AGI_PROGRESS=auto|tty|ndjson|off   auto (default) draws a status line when
+                                       stderr is a terminal and is off
+                                       otherwise; ndjson writes one JSON object
+                                       per update, for CI
+    AGI_PROGRESS_FILE=<path>           where ndjson goes (default: stderr)
+    AGI_PROGRESS_INTERVAL=<seconds>    time between updates (default 0.5)
+
+Transfer code only bumps integer counters on a `Task`. A daemon ticker thread
+samples them once per interval, derives throughput and ETA, and renders, so
+nothing is formatted or written per file or per chunk. When progress is off,
+`task()` returns a shared no-op object.
+"""
+
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import IO, Any, Dict, List, Optional
+
+PROGRESS_ENV = "AGI_PROGRESS"
+PROGRESS_FILE_ENV = "AGI_PROGRESS_FILE"
+PROGRESS_INTERVAL_ENV = "AGI_PROGRESS_INTERVAL"
+DEFAULT_INTERVAL = 0.5
+# Weight of the newest interval in the smoothed throughput
+RATE_SMOOTHING = 0.3
+MB = 1024 * 1024
+
+
+class _NoopTask:
+    """Stand-in returned when progress is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopTask":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def add_total(self, files: int = 0, nbytes: int = 0):
+        pass
+
+    def add_bytes(self, nbytes: int):
+        pass
+
+    def file_done(self):
+        pass
+
+    def file_skipped(self, nbytes: int = 0):
+        pass
+
+    def file_failed(self):
+        pass
+
+    def request_started(self):
+        pass
+
+    def request_finished(self):
+        pass
+
+
+_NOOP_TASK = _NoopTask()
+
+
+class Task:
+    """
+    Counters for one transfer phase. Each task is updated from a single
+    thread; the ticker only reads, so no locking is needed.
+    """
+
+    __slots__ = (
+        "phase",
+        "files_total",
+        "files_done",
+        "files_skipped",
+        "files_failed",
+        "bytes_total",
+        "bytes_done",
+        "in_flight",
+        "started",
+        "rate",
+        "_last_time",
+        "_last_bytes",
+    )
+
+    def __init__(self, phase: str, files: int = 0, nbytes: int = 0):
+        self.phase = phase
+        self.files_total = files
+        self.files_done = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.bytes_total = nbytes
+        self.bytes_done = 0
+        self.in_flight = 0
+        self.started = time.monotonic()
+        self.rate = 0.0
+        self._last_time = self.started
+        self._last_bytes = 0
+
+    def __enter__(self) -> "Task":
+        # Time from when the phase is rendered, not from when it was set up
+        self.started = self._last_time = time.monotonic()
+        _reporter.attach(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _reporter.detach(self)
+        return False
+
+    def add_total(self, files: int = 0, nbytes: int = 0):
+        self.files_total += files
+        self.bytes_total += nbytes
+
+    def add_bytes(self, nbytes: int):
+        self.bytes_done += nbytes
+
+    def file_done(self):
+        self.files_done += 1
+
+    def file_skipped(self, nbytes: int = 0):
+        """A file that needs no transfer; its bytes leave the total."""
+        self.files_done += 1
+        self.files_skipped += 1
+        self.bytes_total -= nbytes
+
+    def file_failed(self):
+        self.files_done += 1
+        self.files_failed += 1
+
+    def request_started(self):
+        self.in_flight += 1
+
+    def request_finished(self):
+        self.in_flight -= 1
+
+    def sample(self, now: float, final: bool = False) -> Dict[str, Any]:
+        """
+        Snapshot the counters and update the smoothed rate; a final sample
+        reports the average rate over the whole task instead.
+        """
+        elapsed = now - self._last_time
+        bytes_done = self.bytes_done
+        if self.bytes_total > 0:
+            # Streamed bodies report encoded chunks, which can round past the size
+            bytes_done = min(bytes_done, self.bytes_total)
+        if final:
+            self.rate = bytes_done / max(now - self.started, 1e-9)
+        elif elapsed > 0:
+            current = (bytes_done - self._last_bytes) / elapsed
+            self.rate = (
+                current
+                if self._last_bytes == 0
+                else RATE_SMOOTHING * current + (1 - RATE_SMOOTHING) * self.rate
+            )
+            self._last_time, self._last_bytes = now, bytes_done
+        remaining = self.bytes_total - bytes_done
+        return {
+            "phase": self.phase,
+            "elapsed_s": round(now - self.started, 3),
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "files_skipped": self.files_skipped,
+            "files_failed": self.files_failed,
+            "bytes_done": bytes_done,
+            "bytes_total": self.bytes_total,
+            "in_flight": self.in_flight,
+            "mb_per_s": round(self.rate / MB, 3),
+            "eta_s": (
+                round(remaining / self.rate, 1)
+                if self.rate > 0 and remaining > 0 and not final
+                else None
+            ),
+        }
+
+
+def _format_line(snapshot: Dict[str, Any]) -> str:
+    parts = [snapshot["phase"]]
+    if snapshot["files_total"]:
+        parts.append(f"{snapshot['files_done']}/{snapshot['files_total']} files")
+    done_mb = snapshot["bytes_done"] / MB
+    if snapshot["bytes_total"] > 0:
+        parts.append(f"{done_mb:.1f}/{snapshot['bytes_total'] / MB:.1f} MB")
+    else:
+        parts.append(f"{done_mb:.1f} MB")
+    parts.append(f"{snapshot['mb_per_s']:.1f} MB/s")
+    if snapshot["eta_s"] is not None:
+        minutes, seconds = divmod(int(snapshot["eta_s"]), 60)
+        parts.append(f"ETA {minutes}:{seconds:02d}")
+    if snapshot["in_flight"]:
+        parts.append(f"{snapshot['in_flight']} in flight")
+    notes = []
+    if snapshot["files_skipped"]:
+        notes.append(f"{snapshot['files_skipped']} unchanged")
+    if snapshot["files_failed"]:
+        notes.append(f"{snapshot['files_failed']} failed")
+    if notes:
+        parts.append(f"({', '.join(notes)})")
+    return "  ".join(parts)
+
+
+class _Reporter:
+    """Renders active tasks from a ticker thread while any are open."""
+
+    def __init__(self, mode: Optional[str], stream: Optional[IO[str]], interval: float):
+        self.mode = mode
+        self.stream = stream
+        self.interval = interval
+        self._tasks: List[Task] = []
+        self._lock = threading.Lock()
+        self._stop: Optional[threading.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, task: Task):
+        with self._lock:
+            self._tasks.append(task)
+            if self.mode == "ndjson":
+                self._emit("start", task.sample(time.monotonic()))
+            if self._thread is None:
+                # A fresh event per ticker, so a stopping one cannot be revived
+                self._stop = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._stop,),
+                    name="agi-progress",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def detach(self, task: Task):
+        with self._lock:
+            self._tasks.remove(task)
+            thread = self._thread if not self._tasks else None
+            if thread is not None:
+                self._stop.set()
+                self._thread = self._stop = None
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            snapshot = task.sample(time.monotonic(), final=True)
+            if self.mode == "ndjson":
+                self._emit("end", snapshot)
+            else:
+                self._draw(_format_line(snapshot), final=True)
+
+    def _run(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            with self._lock:
+                now = time.monotonic()
+                snapshots = [task.sample(now) for task in self._tasks]
+                if self.mode == "ndjson":
+                    for snapshot in snapshots:
+                        self._emit("progress", snapshot)
+                elif snapshots:
+                    self._draw(" | ".join(_format_line(s) for s in snapshots))
+
+    def _emit(self, event: str, snapshot: Dict[str, Any]):
+        self.stream.write(json.dumps({"event": event, **snapshot}) + "\n")
+        self.stream.flush()
+
+    def _draw(self, line: str, final: bool = False):
+        width = shutil.get_terminal_size().columns - 1
+        self.stream.write("\r\x1b[K" + line[:width] + ("\n" if final else ""))
+        self.stream.flush()
+
+
+def _reporter_from_env() -> _Reporter:
+    mode = os.getenv(PROGRESS_ENV, "auto").lower()
+    if mode == "auto":
+        mode = "tty" if sys.stderr.isatty() else "off"
+    if mode not in ("tty", "ndjson"):
+        return _Reporter(None, None, DEFAULT_INTERVAL)
+
+    stream: IO[str] = sys.stderr
+    if mode == "ndjson" and os.getenv(PROGRESS_FILE_ENV):
+        # Line-buffered append, so several CLI runs can share one stream
+        stream = open(os.environ[PROGRESS_FILE_ENV], "a", buffering=1)
+    try:
+        interval = float(os.getenv(PROGRESS_INTERVAL_ENV, DEFAULT_INTERVAL))
+    except ValueError:
+        interval = DEFAULT_INTERVAL
+    return _Reporter(mode, stream, max(interval, 0.05))
+
+
+_reporter = _reporter_from_env()
+enabled = _reporter.mode is not None
+
+
+def task(phase: str, files: int = 0, nbytes: int = 0):
+    """
+    Start tracking a transfer phase as a context manager; it is rendered
+    while open. Totals can be given up front or added via `add_total()`.
+    """
+    if not enabled:
+        return _NOOP_TASK
+    return Task(phase, files, nbytes)
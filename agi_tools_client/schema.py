@@ -0,0 +1,179 @@
+"""
+OpenAPI schema resolution for command generation.
+
+`SchemaResolver` indexes `components/schemas` once per spec and materializes
+request-body schemas: `$ref`s are followed at any depth, `allOf` parts are
+merged, and `anyOf`/`oneOf` variants are resolved in place. Resolved refs are
+memoized, so every component is resolved at most once however many operations
+use it, and recursive schemas are cut off at the point where they recurse.
+"""
+
+from typing import Any, Dict, List, Optional, Set
+
+# Map OpenAPI "type" to Python types.
+TYPE_MAP = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+SCHEMA_REF_PREFIX = "#/components/schemas/"
+UNION_KEYS = ("anyOf", "oneOf")
+NESTED_SCHEMA_KEYS = ("items", "additionalProperties", "not")
+
+
+def _merge_schema(target: Dict[str, Any], source: Dict[str, Any]):
+    """Merge an allOf part into target; keys already on target take precedence."""
+    for key, value in source.items():
+        if key == "properties":
+            properties = target.setdefault("properties", {})
+            for name, prop in value.items():
+                properties.setdefault(name, prop)
+        elif key == "required":
+            target["required"] = list(dict.fromkeys(target.get("required", []) + value))
+        else:
+            target.setdefault(key, value)
+
+
+def schema_type(schema: Dict[str, Any]) -> str:
+    """Return the effective OpenAPI type, looking through nullable unions."""
+    type_info = schema.get("type")
+    if isinstance(type_info, list):
+        type_info = next((t for t in type_info if t != "null"), None)
+    if type_info and type_info != "null":
+        return type_info
+
+    for key in UNION_KEYS:
+        for variant in schema.get(key, []):
+            if isinstance(variant, dict) and variant.get("type") not in (None, "null"):
+                return schema_type(variant)
+    return "string"
+
+
+def python_type(schema: Dict[str, Any]) -> Any:
+    """
+    Return the annotation for a CLI parameter. Arrays become List[item type];
+    objects are taken as JSON strings, since Typer cannot parse dicts, and
+    parsed by the command before it is sent.
+    """
+    type_info = schema_type(schema)
+    if type_info == "array":
+        items = schema.get("items")
+        if items is None:
+            items = next(
+                (
+                    variant.get("items")
+                    for key in UNION_KEYS
+                    for variant in schema.get(key, [])
+                    if isinstance(variant, dict) and "items" in variant
+                ),
+                None,
+            )
+        item_type = schema_type(items) if isinstance(items, dict) else "string"
+        if item_type in ("array", "object"):
+            item_type = "string"
+        return List[TYPE_MAP[item_type]]
+    if type_info == "object":
+        return str
+    return TYPE_MAP.get(type_info, str)
+
+
+class SchemaResolver:
+    """Resolves and caches schemas and parameter descriptors for one spec."""
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.spec = spec
+        schemas = spec.get("components", {}).get("schemas", {})
+        self._index = {SCHEMA_REF_PREFIX + name: s for name, s in schemas.items()}
+        self._resolved: Dict[str, Dict[str, Any]] = {}
+        self._in_progress: Set[str] = set()
+        self._descriptors: Dict[int, List[Dict[str, Any]]] = {}
+
+    def resolve(self, schema: Any) -> Dict[str, Any]:
+        """Return a fully materialized copy of schema."""
+        if not isinstance(schema, dict):
+            return {}
+        if "$ref" in schema:
+            resolved = self.resolve_ref(schema["$ref"])
+            siblings = {k: v for k, v in schema.items() if k != "$ref"}
+            if not siblings:
+                return resolved
+            # OpenAPI 3.1 allows keywords such as description next to $ref
+            merged = self._materialize(siblings)
+            _merge_schema(merged, resolved)
+            return merged
+        return self._materialize(schema)
+
+    def resolve_ref(self, ref: str) -> Dict[str, Any]:
+        if ref in self._resolved:
+            return self._resolved[ref]
+        if ref in self._in_progress:
+            # Recursive schema: describe the inner occurrence as a plain object
+            return {"type": "object", "x-recursive-ref": ref}
+
+        target = self._index.get(ref)
+        if target is None:
+            target = self._lookup_pointer(ref)
+
+        self._in_progress.add(ref)
+        try:
+            resolved = self.resolve(target)
+        finally:
+            self._in_progress.discard(ref)
+        self._resolved[ref] = resolved
+        return resolved
+
+    def _lookup_pointer(self, ref: str) -> Optional[Dict[str, Any]]:
+        """Follow a local JSON pointer that is not a components/schemas entry."""
+        if not ref.startswith("#/"):
+            return None
+        current: Any = self.spec
+        for part in ref[2:].split("/"):
+            part = part.replace("~1", "/").replace("~0", "~")
+            if not isinstance(current, dict) or part not in current:
+                return None
+            current = current[part]
+        return current if isinstance(current, dict) else None
+
+    def _materialize(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for key, value in schema.items():
+            if key == "allOf":
+                continue
+            if key == "properties" and isinstance(value, dict):
+                result[key] = {name: self.resolve(p) for name, p in value.items()}
+            elif key in NESTED_SCHEMA_KEYS and isinstance(value, dict):
+                result[key] = self.resolve(value)
+            elif key in UNION_KEYS and isinstance(value, list):
+                result[key] = [self.resolve(variant) for variant in value]
+            else:
+                result[key] = value
+
+        for part in schema.get("allOf", []):
+            _merge_schema(result, self.resolve(part))
+        return result
+
+    def body_schema(self, operation: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the resolved application/json requestBody schema of operation."""
+        req_body = operation.get("requestBody", {})
+        if "$ref" in req_body:
+            req_body = self._lookup_pointer(req_body["$ref"]) or {}
+        content = req_body.get("content", {})
+        return self.resolve(content.get("application/json", {}).get("schema", {}))
+
+    def describe_parameters(self, operation: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Return one descriptor per request-body property: its name, the resolved
+        property schema and the Python annotation to use for it.
+        """
+        key = id(operation)
+        if key not in self._descriptors:
+            properties = self.body_schema(operation).get("properties", {})
+            self._descriptors[key] = [
+                {"name": name, "spec": prop, "annotation": python_type(prop)}
+                for name, prop in properties.items()
+            ]
+        return self._descriptors[key]
@@ -0,0 +1,151 @@
+"""
+Host-wide, content-addressed record of uploads.
+
+Every workspace on a host shares one SQLite index that maps a volume
+destination to the SHA-256 of the content last uploaded there. A checkout that
+has never synced can hash its files and skip every upload whose bytes the host
+already pushed to the same destination, instead of re-sending the workspace.
+Downloads record the content they find on the volume as well, and records in
+directories a command may have rewritten are dropped until a download
+confirms them again.
+
+The index lives in AGI_STORE_DIR (default: $XDG_CACHE_HOME/agi-tools, or
+~/.cache/agi-tools) and is bounded to AGI_STORE_MAX_ENTRIES records; the least
+recently used records are evicted first. Set AGI_STORE=0 to disable it.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STORE_ENV = "AGI_STORE"
+STORE_DIR_ENV = "AGI_STORE_DIR"
+STORE_MAX_ENTRIES_ENV = "AGI_STORE_MAX_ENTRIES"
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    volume TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (volume, destination)
+);
+CREATE INDEX IF NOT EXISTS uploads_last_used ON uploads (last_used);
+"""
+
+
+def volume_key(api_url: str, agint_apikey: str) -> str:
+    """Identify a volume by endpoint and API key without storing the key."""
+    return hashlib.sha256(f"{api_url}\0{agint_apikey}".encode("utf-8")).hexdigest()[:32]
+
+
+def default_store_dir() -> Path:
+    if os.getenv(STORE_DIR_ENV):
+        return Path(os.environ[STORE_DIR_ENV])
+    cache_home = os.getenv("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "agi-tools"
+
+
+class ObjectStore:
+    """Upload records shared by every workspace on the host."""
+
+    def __init__(self, path: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Several CLI processes may sync at once; wait for each other's writes
+        self._conn = sqlite3.connect(str(path), timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    @classmethod
+    def open_default(cls) -> Optional["ObjectStore"]:
+        """Open the host store, or return None if it is disabled or unusable."""
+        if os.getenv(STORE_ENV, "1") == "0":
+            return None
+        try:
+            max_entries = int(os.getenv(STORE_MAX_ENTRIES_ENV, DEFAULT_MAX_ENTRIES))
+            return cls(default_store_dir() / "store.db", max_entries)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.warning(f"Shared upload store unavailable, continuing without: {e}")
+            return None
+
+    def has_upload(self, volume: str, destination: str, digest: str) -> bool:
+        """
+        Check whether this exact content was already uploaded to destination.
+        A store error counts as a miss, so the caller uploads.
+        """
+        try:
+            row = self._conn.execute(
+                "SELECT hash FROM uploads WHERE volume = ? AND destination = ?",
+                (volume, destination),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared upload store lookup failed: {e}")
+            return False
+        return row is not None and row[0] == digest
+
+    def record_uploads(
+        self, volume: str, records: Iterable[Tuple[str, str, int]]
+    ) -> None:
+        """
+        Record (destination, digest, size) entries as present on the volume, and
+        refresh their LRU position. Written in a single transaction.
+        """
+        now = time.time()
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (volume, dest, digest, size, now)
+                        for dest, digest, size in records
+                    ),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to update shared upload store: {e}")
+
+    def forget(self, volume: str, prefixes: Iterable[str]) -> None:
+        """
+        Drop the records of every destination on the volume that starts with
+        one of prefixes, once what the volume holds there is no longer known.
+        """
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM uploads WHERE volume = ? "
+                    "AND substr(destination, 1, ?) = ?",
+                    ((volume, len(prefix), prefix) for prefix in prefixes),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to update shared upload store: {e}")
+
+    def collect_garbage(self) -> int:
+        """Evict the least recently used records beyond max_entries."""
+        try:
+            with self._conn:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM uploads").fetchone()
+                excess = count - self.max_entries
+                if excess <= 0:
+                    return 0
+                self._conn.execute(
+                    "DELETE FROM uploads WHERE rowid IN "
+                    "(SELECT rowid FROM uploads ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared upload store cleanup failed: {e}")
+            return 0
+        return excess
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,199 @@
+"""
+Compact per-workspace record of synced files.
+
+The index remembers the mtime and size each workspace file had when it was
+last synced, so unchanged files are skipped. It is stored column-wise: one
+sorted list of relative paths, which is the only copy of each path string,
+plus parallel `array` columns of mtimes and sizes. Lookups bisect the path
+list, so a million entries cost little more than the path strings
+themselves instead of a dict per file.
+
+A sync updates the index in place. Entries are marked as they are confirmed
+on the volume, and `compact()` drops the ones that were not, which covers
+files deleted since the last sync and uploads that failed. On disk the
+columns are written as raw arrays followed by the NUL-separated paths, so
+loading is a few bulk copies and one split rather than a JSON parse. The
+JSON dict written by earlier versions can still be read, via `from_mapping`.
+"""
+
+import itertools
+import operator
+import os
+import stat
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+MAGIC = b"AGISYNC1"
+# Magic, entry count, byte length of the path table
+_HEADER = struct.Struct("<8sQQ")
+_PATH_SEPARATOR = "\0"
+_SWAP_BYTES = sys.byteorder != "little"
+# Read once at import; os.umask() can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class SyncIndex:
+    """Sorted path table with parallel mtime and size columns."""
+
+    __slots__ = ("_paths", "_mtimes", "_sizes", "_marked", "_added")
+
+    def __init__(
+        self,
+        paths: Optional[List[str]] = None,
+        mtimes: Optional[array] = None,
+        sizes: Optional[array] = None,
+    ):
+        # paths must be sorted; the columns are indexed by position in it
+        self._paths: List[str] = paths if paths is not None else []
+        self._mtimes = mtimes if mtimes is not None else array("d")
+        self._sizes = sizes if sizes is not None else array("q")
+        if not len(self._paths) == len(self._mtimes) == len(self._sizes):
+            raise ValueError("Sync index columns differ in length")
+        self._marked = bytearray(len(self._paths))
+        # Paths first seen in this sync, folded into the columns by compact()
+        self._added: Dict[str, Tuple[float, int]] = {}
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, Any]) -> "SyncIndex":
+        """Build an index from the legacy {path: {"mtime", "size"}} JSON dict."""
+        paths, mtimes, sizes = [], array("d"), array("q")
+        for path in sorted(mapping):
+            entry = mapping[path]
+            try:
+                mtime, size = float(entry["mtime"]), int(entry["size"])
+            except (TypeError, KeyError, ValueError):
+                continue
+            paths.append(path)
+            mtimes.append(mtime)
+            sizes.append(size)
+        return cls(paths, mtimes, sizes)
+
+    @classmethod
+    def load(cls, path: Path) -> "SyncIndex":
+        """Read an index written by save(); raises ValueError if it is corrupt."""
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError("Sync index is truncated")
+        magic, count, paths_length = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a sync index file")
+        offset = _HEADER.size
+        if len(data) != offset + 16 * count + paths_length:
+            raise ValueError("Sync index is truncated")
+
+        view = memoryview(data)
+        mtimes, sizes = array("d"), array("q")
+        mtimes.frombytes(view[offset : offset + 8 * count])
+        offset += 8 * count
+        sizes.frombytes(view[offset : offset + 8 * count])
+        offset += 8 * count
+        if _SWAP_BYTES:
+            mtimes.byteswap()
+            sizes.byteswap()
+        paths = (
+            str(view[offset:], "utf-8", "surrogateescape").split(_PATH_SEPARATOR)
+            if count
+            else []
+        )
+        view.release()
+        return cls(paths, mtimes, sizes)
+
+    def save(self, path: Path):
+        """Write the index atomically; call compact() first to drop stale entries."""
+        self._fold_added()
+        paths_blob = _PATH_SEPARATOR.join(self._paths).encode(
+            "utf-8", "surrogateescape"
+        )
+        mtimes, sizes = self._mtimes, self._sizes
+        if _SWAP_BYTES:
+            mtimes, sizes = array("d", mtimes), array("q", sizes)
+            mtimes.byteswap()
+            sizes.byteswap()
+
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        fd, temp_path = tempfile.mkstemp(
+            prefix=f"{path.name}.", suffix=".tmp", dir=str(path.parent)
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # mkstemp files are owner-only; keep the mode the index had
+                os.chmod(temp_path, mode)
+                f.write(_HEADER.pack(MAGIC, len(self._paths), len(paths_blob)))
+                f.write(mtimes.tobytes())
+                f.write(sizes.tobytes())
+                f.write(paths_blob)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _row(self, path: str) -> int:
+        row = bisect_left(self._paths, path)
+        if row < len(self._paths) and self._paths[row] == path:
+            return row
+        return -1
+
+    def is_current(self, path: str, mtime: float, size: int) -> bool:
+        """Check whether path was synced with exactly this mtime and size."""
+        row = self._row(path)
+        if row < 0:
+            return self._added.get(path) == (mtime, size)
+        return self._mtimes[row] == mtime and self._sizes[row] == size
+
+    def mark(self, path: str, mtime: float, size: int):
+        """Record path as present on the volume with this mtime and size."""
+        row = self._row(path)
+        if row < 0:
+            self._added[path] = (mtime, size)
+            return
+        self._mtimes[row] = mtime
+        self._sizes[row] = size
+        self._marked[row] = 1
+
+    def __contains__(self, path: object) -> bool:
+        """Whether path has been marked since the index was loaded."""
+        if not isinstance(path, str):
+            return False
+        row = self._row(path)
+        return bool(self._marked[row]) if row >= 0 else path in self._added
+
+    def __len__(self) -> int:
+        return len(self._paths) + len(self._added)
+
+    def compact(self):
+        """Drop every entry that was not marked since the index was loaded."""
+        if 0 in self._marked:
+            self._paths = list(itertools.compress(self._paths, self._marked))
+            self._mtimes = array("d", itertools.compress(self._mtimes, self._marked))
+            self._sizes = array("q", itertools.compress(self._sizes, self._marked))
+        self._marked = bytearray(b"\1" * len(self._paths))
+        self._fold_added()
+
+    def _fold_added(self):
+        if not self._added:
+            return
+        rows = sorted(
+            itertools.chain(
+                zip(self._paths, self._mtimes, self._sizes, self._marked),
+                ((p, m, s, 1) for p, (m, s) in self._added.items()),
+            ),
+            key=operator.itemgetter(0),
+        )
+        self._paths = [row[0] for row in rows]
+        self._mtimes = array("d", (row[1] for row in rows))
+        self._sizes = array("q", (row[2] for row in rows))
+        self._marked = bytearray(row[3] for row in rows)
+        self._added = {}
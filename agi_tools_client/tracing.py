@@ -0,0 +1,217 @@
+"""
+Lightweight span tracing for the CLI.
+
+Tracing is configured once from the environment:
+
+    AGI_TRACE=stderr|stdout|<path>   where to export finished spans
+    AGI_TRACE_FORMAT=json|otlp       one JSON object per span (default), or an
+                                     OTLP/JSON `resourceSpans` document
+
+When AGI_TRACE is unset, `span()` returns a shared no-op object, so
+instrumented code pays for little more than a function call.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+TRACE_ENV = "AGI_TRACE"
+TRACE_FORMAT_ENV = "AGI_TRACE_FORMAT"
+SERVICE_NAME = "agi-tools-client"
+
+_current_span = contextvars.ContextVar("agi_tools_current_span", default=None)
+
+
+class _NoopSpan:
+    """Stand-in returned when tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set(self, key: str, value: Any) -> "_NoopSpan":
+        return self
+
+    def add(self, key: str, amount: float = 1) -> "_NoopSpan":
+        return self
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed operation with attributes, nested under the active span."""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+        "_token",
+    )
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        _exporter.record(self)
+        return False
+
+    def set(self, key: str, value: Any) -> "Span":
+        self.attributes[key] = value
+        return self
+
+    def add(self, key: str, amount: float = 1) -> "Span":
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": (
+                {"code": 2, "message": self.error} if self.error else {"code": 1}
+            ),
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class _Exporter:
+    """Buffers finished spans and writes them once at interpreter exit."""
+
+    def __init__(self, target: Optional[str], fmt: str):
+        self.target = target
+        self.format = fmt
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+        if target:
+            atexit.register(self.flush)
+
+    def record(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def flush(self):
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans or not self.target:
+            return
+
+        if self.format == "otlp":
+            document = {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                _otlp_attribute("service.name", SERVICE_NAME)
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "agi_tools_client"},
+                                "spans": [span.to_otlp() for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            }
+            text = json.dumps(document) + "\n"
+        else:
+            text = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+
+        if self.target in ("stdout", "stderr"):
+            stream = sys.stdout if self.target == "stdout" else sys.stderr
+            stream.write(text)
+            stream.flush()
+        else:
+            # Append so that several CLI invocations can share one trace file
+            with open(self.target, "a") as f:
+                f.write(text)
+
+
+_exporter = _Exporter(
+    os.getenv(TRACE_ENV) or None, os.getenv(TRACE_FORMAT_ENV, "json").lower()
+)
+enabled = _exporter.target is not None
+
+
+def span(name: str, **attributes: Any):
+    """
+    Start a span as a context manager. Attributes can be set up front or added
+    while the span is open via `set()` and `add()`.
+    """
+    if not enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def flush():
+    """Export buffered spans now instead of waiting for interpreter exit."""
+    _exporter.flush()
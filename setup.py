@@ -37,6 +37,8 @@ setup(
             "schemagin=agi_tools_client.cli:schemagin",
             "datagin=agi_tools_client.cli:datagin",
             "agitransfer=agi_tools_client.cli:agitransfer",
+            "agi-tools-mock-server=agi_tools_client.mock_server:run",
+            "agi-tools-bench=agi_tools_client.bench:main",
         ],
     },
 ) 
\ No newline at end of file
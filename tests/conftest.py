@@ -0,0 +1,32 @@
+import importlib
+
+import pytest
+
+from agi_tools_client.mock_server import MockServer
+
+
+@pytest.fixture(scope="session")
+def mock_server(tmp_path_factory):
+    with MockServer(tmp_path_factory.mktemp("volume")) as server:
+        yield server
+
+
+@pytest.fixture
+def cli(mock_server, tmp_path, monkeypatch):
+    """The cli module, built from the mock server's spec, with a private store."""
+    monkeypatch.setenv("DOCKER_BUILDER_API_URL", mock_server.url)
+    monkeypatch.delenv("DOCKER_BUILDER_API_URLS", raising=False)
+    monkeypatch.setenv("AGINT_APIKEY", "test-key")
+    monkeypatch.setenv("AGI_STORE_DIR", str(tmp_path / "store"))
+    # Importing the CLI fetches the spec once; later tests reuse the module
+    module = importlib.import_module("agi_tools_client.cli")
+    # The sync index paths are resolved against the CWD at import
+    monkeypatch.setattr(
+        module, "_upload_cache_file", tmp_path / module.UPLOAD_CACHE_FILE
+    )
+    monkeypatch.setattr(
+        module,
+        "_legacy_upload_cache_file",
+        tmp_path / module.LEGACY_UPLOAD_CACHE_FILE,
+    )
+    return module
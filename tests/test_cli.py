@@ -0,0 +1,297 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+import pytest
+import typer
+
+from agi_tools_client import schema
+from agi_tools_client.mock_server import MockServer
+from agi_tools_client.store import ObjectStore, volume_key
+
+
+def test_type_map_is_reexported(cli):
+    assert cli.TYPE_MAP is schema.TYPE_MAP
+
+
+@pytest.fixture
+def volume_server(tmp_path):
+    with MockServer(tmp_path / "volume") as server:
+        yield server
+
+
+def _tree(root):
+    return {
+        path.relative_to(root).as_posix(): path.read_bytes()
+        for path in root.rglob("*")
+        if path.is_file() and not path.name.startswith(".")
+    }
+
+
+@pytest.mark.parametrize("mode", ["fanout", "zip"])
+def test_upload_download_round_trip(cli, volume_server, tmp_path, monkeypatch, mode):
+    monkeypatch.setenv("AGI_DOWNLOAD_MODE", mode)
+    source = tmp_path / "source"
+    (source / "nested" / "deeper").mkdir(parents=True)
+    (source / "a.txt").write_text("alpha\n")
+    (source / "nested" / "b.bin").write_bytes(os.urandom(100_000))
+    (source / "nested" / "deeper" / "empty").write_bytes(b"")
+    (source / ".hidden").write_text("not synced")
+    monkeypatch.chdir(source)
+    cli._perform_upstream_sync(volume_server.url, "test-key")
+    assert _tree(volume_server.root) == _tree(source)
+
+    copy = tmp_path / "copy"
+    copy.mkdir()
+    monkeypatch.chdir(copy)
+    cli._synchronize_user_directory(volume_server.url, "test-key")
+    assert _tree(copy) == _tree(source)
+    assert not (copy / ".hidden").exists()
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("outputs", "outputs"),
+        ("./outputs/run/", "outputs/run"),
+        ("outputs/../results", "results"),
+        (".", ""),
+        ("agitransfer://", ""),
+        ("agitransfer:///outputs/run", "outputs/run"),
+        ("agitransfer://outputs/../..", None),
+        ("../outside", None),
+        ("/abs/path", None),
+    ],
+)
+def test_normalize_volume_dir(cli, path, expected):
+    assert cli._normalize_volume_dir(path) == expected
+
+
+@pytest.mark.parametrize(
+    "directories, expected",
+    [
+        (["b", "a/x", "a", "a/x/y"], ["a", "b"]),
+        (["ab", "a"], ["a", "ab"]),
+        (["out", "out"], ["out"]),
+        (["out", ""], None),
+    ],
+)
+def test_collapse_directories(cli, directories, expected):
+    assert cli._collapse_directories(directories) == expected
+
+
+@pytest.mark.parametrize(
+    "kwargs, response, expected",
+    [
+        # Artifacts win over the output directory argument
+        (
+            {"output_dir": "ignored"},
+            {"artifacts": ["agitransfer://out/a.json", "agitransfer://out/sub/b"]},
+            ["out"],
+        ),
+        ({"output_dir": "results/run"}, {"artifacts": []}, ["results/run"]),
+        ({"output_dir": "results/run"}, {}, ["results/run"]),
+        # Nothing known, or a path outside the volume: sync everything
+        ({}, {}, None),
+        ({"output_dir": ""}, {}, None),
+        ({"output_dir": "/abs"}, {}, None),
+        ({}, {"artifacts": ["agitransfer://top.json"]}, None),
+        ({}, {"artifacts": ["agitransfer://a/x", "../escape/y"]}, None),
+    ],
+)
+def test_post_sync_scope(cli, kwargs, response, expected):
+    assert cli._post_sync_scope(kwargs, response) == expected
+
+
+SCAN_ORDER = ["old_big", "ref", "hour", "old_small", "new_big"]
+
+
+@pytest.fixture
+def upload_files(tmp_path):
+    now = time.time()
+    layout = {
+        "old_big": (100, now - 2 * 24 * 60 * 60),
+        "ref": (1000, now - 2 * 24 * 60 * 60),
+        "hour": (10, now - 30 * 60),
+        "old_small": (1, now - 2 * 24 * 60 * 60),
+        "new_big": (50, now),
+    }
+    for name, (size, mtime) in layout.items():
+        (tmp_path / name).write_bytes(b"x" * size)
+        os.utime(tmp_path / name, (mtime, mtime))
+    return [tmp_path / name for name in SCAN_ORDER]
+
+
+@pytest.mark.parametrize(
+    "order, expected",
+    [
+        (None, ["ref", "new_big", "hour", "old_small", "old_big"]),
+        ("small", ["old_small", "hour", "new_big", "old_big", "ref"]),
+        ("recent", ["new_big", "hour", "old_big", "ref", "old_small"]),
+        ("referenced", ["ref", "old_big", "hour", "old_small", "new_big"]),
+        ("recent,small", ["new_big", "hour", "old_small", "old_big", "ref"]),
+        ("scan", SCAN_ORDER),
+        ("", SCAN_ORDER),
+        ("bogus, SMALL", ["old_small", "hour", "new_big", "old_big", "ref"]),
+    ],
+)
+def test_order_uploads(cli, upload_files, tmp_path, monkeypatch, order, expected):
+    if order is None:
+        monkeypatch.delenv("AGI_UPLOAD_ORDER", raising=False)
+    else:
+        monkeypatch.setenv("AGI_UPLOAD_ORDER", order)
+    ordered = cli._order_uploads(upload_files, tmp_path, {"ref"})
+    assert [item.name for item, _ in ordered] == expected
+    assert [st.st_size for _, st in ordered] == [
+        (tmp_path / name).stat().st_size for name in expected
+    ]
+
+
+def test_order_uploads_skips_vanished_files(cli, upload_files, tmp_path):
+    (tmp_path / "hour").unlink()
+    ordered = cli._order_uploads(upload_files, tmp_path, set())
+    assert "hour" not in [item.name for item, _ in ordered]
+    assert len(ordered) == len(upload_files) - 1
+
+
+@pytest.mark.parametrize(
+    "offset, large", [(-1, False), (0, False), (1, True), (1024 * 1024, True)]
+)
+def test_large_upload_lane_boundary(cli, offset, large):
+    assert cli.LARGE_UPLOAD_THRESHOLD == 4 * 1024 * 1024
+    assert cli._is_large_upload(cli.LARGE_UPLOAD_THRESHOLD + offset) is large
+
+
+def _store_has(api_url, destination, data):
+    store = ObjectStore.open_default()
+    try:
+        return store.has_upload(
+            volume_key(api_url, "test-key"),
+            f"agitransfer://{destination}",
+            hashlib.sha256(data).hexdigest(),
+        )
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("mode", ["fanout", "zip"])
+def test_download_replaces_stale_store_records(
+    cli, volume_server, tmp_path, monkeypatch, mode
+):
+    monkeypatch.setenv("AGI_DOWNLOAD_MODE", mode)
+    url = volume_server.url
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "a.txt").write_bytes(b"before")
+    (tmp_path / "b.txt").write_bytes(b"kept")
+    monkeypatch.chdir(tmp_path)
+    cli._perform_upstream_sync(url, "test-key")
+    assert _store_has(url, "out/a.txt", b"before")
+
+    # A command rewrites out/a.txt on the volume
+    (volume_server.root / "out" / "a.txt").write_bytes(b"after")
+    cli._synchronize_user_directory(url, "test-key", ["out"])
+    assert (tmp_path / "out" / "a.txt").read_bytes() == b"after"
+    assert not _store_has(url, "out/a.txt", b"before")
+    assert _store_has(url, "out/a.txt", b"after")
+    assert _store_has(url, "b.txt", b"kept")
+
+
+def test_forget_volume_uploads(cli):
+    url = "http://forget.invalid"
+    store = ObjectStore.open_default()
+    try:
+        for key in ("test-key", "other-key"):
+            store.record_uploads(
+                volume_key(url, key),
+                [
+                    ("agitransfer://out/a", hashlib.sha256(b"a").hexdigest(), 1),
+                    ("agitransfer://top", hashlib.sha256(b"t").hexdigest(), 1),
+                ],
+            )
+    finally:
+        store.close()
+
+    cli._forget_volume_uploads(url, "test-key", ["out"])
+    assert not _store_has(url, "out/a", b"a")
+    assert _store_has(url, "top", b"t")
+    cli._forget_volume_uploads(url, "test-key", None)
+    assert not _store_has(url, "top", b"t")
+
+    store = ObjectStore.open_default()
+    try:
+        assert store.has_upload(
+            volume_key(url, "other-key"),
+            "agitransfer://out/a",
+            hashlib.sha256(b"a").hexdigest(),
+        )
+    finally:
+        store.close()
+
+
+def test_record_extracted_files(cli, tmp_path):
+    url = "http://record.invalid"
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "x.txt").write_bytes(b"x")
+    (tmp_path / "y.txt").write_bytes(b"y")
+    cli._record_extracted_files(
+        url, "test-key", "out", str(tmp_path), ["sub/", "sub/x.txt", "y.txt", "gone"]
+    )
+    assert _store_has(url, "out/sub/x.txt", b"x")
+    assert _store_has(url, "out/y.txt", b"y")
+    assert not _store_has(url, "out/gone", b"")
+
+
+@pytest.fixture
+def two_endpoints(cli, tmp_path, monkeypatch):
+    monkeypatch.setenv("DOCKER_BUILDER_API_URLS", "http://one,http://two")
+    return tmp_path / "store" / "endpoints.db"
+
+
+def _leases(db):
+    conn = sqlite3.connect(str(db))
+    try:
+        return conn.execute("SELECT COUNT(*) FROM endpoint_leases").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_run_on_endpoint_releases_the_lease_after_an_error(cli, two_endpoints):
+    seen = []
+
+    def run(api_url):
+        seen.append(api_url)
+        assert _leases(two_endpoints) == 1
+        raise RuntimeError("command failed")
+
+    with pytest.raises(RuntimeError):
+        cli._run_on_endpoint(run)
+    assert seen == ["http://one"]
+    assert _leases(two_endpoints) == 0
+
+
+def test_run_on_endpoint_fails_over_and_benches(cli, two_endpoints):
+    seen = []
+
+    def run(api_url):
+        seen.append(api_url)
+        if api_url == "http://one":
+            raise cli._EndpointUnavailable() from ConnectionError("refused")
+
+    cli._run_on_endpoint(run)
+    assert seen == ["http://one", "http://two"]
+    assert _leases(two_endpoints) == 0
+    # The unreachable endpoint stays benched for the next command
+    seen.clear()
+    cli._run_on_endpoint(run)
+    assert seen == ["http://two"]
+
+
+def test_run_on_endpoint_exits_when_all_are_unreachable(cli, two_endpoints):
+    def run(api_url):
+        raise cli._EndpointUnavailable() from ConnectionError("refused")
+
+    with pytest.raises(typer.Exit) as excinfo:
+        cli._run_on_endpoint(run)
+    assert excinfo.value.exit_code == 1
+    assert _leases(two_endpoints) == 0
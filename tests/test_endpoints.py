@@ -0,0 +1,144 @@
+import sqlite3
+
+import pytest
+
+from agi_tools_client import endpoints
+from agi_tools_client.endpoints import (
+    BENCH_SECONDS,
+    LEASE_TTL,
+    MAX_BENCH_SECONDS,
+    EndpointRouter,
+    configured_endpoints,
+)
+
+A, B, C = "http://a", "http://b", "http://c"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(endpoints.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def router(tmp_path, clock):
+    opened = EndpointRouter([A, B, C], tmp_path / "endpoints.db")
+    yield opened
+    opened.close()
+
+
+def lease_count(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "endpoints.db"))
+    try:
+        return conn.execute("SELECT COUNT(*) FROM endpoint_leases").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_configured_endpoints(monkeypatch):
+    monkeypatch.setenv("DOCKER_BUILDER_API_URLS", " http://a/, http://b,,http://a")
+    assert configured_endpoints() == [A, B]
+    monkeypatch.setenv("DOCKER_BUILDER_API_URLS", "")
+    monkeypatch.setenv("DOCKER_BUILDER_API_URL", "http://single")
+    assert configured_endpoints() == ["http://single"]
+
+
+def test_unknown_endpoints_keep_configured_order(router):
+    assert router.ranked() == [A, B, C]
+
+
+def test_leases_spread_commands_and_release_drops_them(router, tmp_path):
+    leases = [router.acquire() for _ in range(3)]
+    assert [url for url, _ in leases] == [A, B, C]
+    assert lease_count(tmp_path) == 3
+    # Every endpoint is busy once; the next command doubles up on the first
+    assert router.acquire()[0] == A
+    for url, lease in leases:
+        router.release(lease, url, None)
+    assert lease_count(tmp_path) == 1
+
+
+def test_ranking_weighs_leases_by_latency(router):
+    router.release(None, A, 10.0)
+    router.release(None, B, 1.0)
+    router.release(None, C, 4.0)
+    assert router.ranked() == [B, C, A]
+    for _ in range(3):
+        assert router.acquire(exclude=[C])[0] == B
+    # (3 + 1) x 1.0 ties with C's 4.0; ties keep configured order
+    assert router.ranked() == [B, C, A]
+    router.acquire(exclude=[C])
+    assert router.ranked() == [C, B, A]
+
+
+def test_latency_is_a_moving_average(router):
+    router.release(None, A, 10.0)
+    router.release(None, A, 0.0)
+    router.release(None, B, 6.0)
+    router.release(None, C, 20.0)
+    # A averages 10 x 0.7 = 7, above B's 6
+    assert router.ranked() == [B, A, C]
+
+
+def test_acquire_skips_excluded_endpoints(router):
+    assert router.acquire(exclude=[A])[0] == B
+    assert router.acquire(exclude=[A, B])[0] == C
+
+
+def test_benched_endpoint_is_skipped_until_its_cooldown_ends(router, clock):
+    router.record_failure(A)
+    assert router.ranked() == [B, C, A]
+    assert router.acquire()[0] == B
+
+    clock.now += BENCH_SECONDS - 1
+    assert router.ranked()[-1] == A
+    clock.now += 2
+    assert router.ranked()[0] == A
+
+
+def test_cooldown_doubles_up_to_the_cap(router, clock):
+    for failures in range(1, 8):
+        router.record_failure(A)
+        cooldown = min(BENCH_SECONDS * 2 ** (failures - 1), MAX_BENCH_SECONDS)
+        clock.now += cooldown - 1
+        assert router.ranked()[-1] == A
+        clock.now += 2
+        assert router.ranked()[0] == A
+
+
+def test_benched_endpoints_rank_by_cooldown_end(router, clock):
+    router.record_failure(B)
+    router.record_failure(B)
+    clock.now += 1
+    router.record_failure(A)
+    assert router.ranked() == [C, A, B]
+
+
+def test_success_clears_the_bench(router, clock):
+    router.record_failure(A)
+    router.record_failure(A)
+    router.release(None, A, 1.0)
+    assert router.ranked()[0] == A
+    # The failure count restarted, so the next cool-down is the shortest
+    router.record_failure(A)
+    clock.now += BENCH_SECONDS + 1
+    assert router.ranked()[0] == A
+
+
+def test_stale_leases_expire(router, clock, tmp_path):
+    router.acquire()
+    router.acquire()
+    assert router.ranked()[0] == C
+    clock.now += LEASE_TTL + 1
+    assert router.ranked() == [A, B, C]
+    router.acquire()
+    assert lease_count(tmp_path) == 1
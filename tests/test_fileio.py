@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from agi_tools_client import fileio
+
+
+def _write(path, size):
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return data
+
+
+@pytest.mark.parametrize(
+    "size",
+    [
+        0,
+        1,
+        2,
+        3,
+        fileio.CHUNK_SIZE - 1,
+        fileio.CHUNK_SIZE,
+        fileio.CHUNK_SIZE + 1,
+        5 * fileio.CHUNK_SIZE + 1,
+    ],
+)
+def test_iter_base64_matches_b64encode(tmp_path, size):
+    data = _write(tmp_path / "f", size)
+    encoded = b"".join(fileio.iter_base64(str(tmp_path / "f")))
+    assert encoded == base64.b64encode(data)
+    assert len(encoded) == fileio.base64_length(size)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 7, 4096])
+def test_iter_base64_realigns_uneven_chunks(tmp_path, chunk_size):
+    data = _write(tmp_path / "f", 10_001)
+    encoded = b"".join(fileio.iter_base64(str(tmp_path / "f"), chunk_size))
+    assert encoded == base64.b64encode(data)
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+def test_iter_base64_reads_pipes(tmp_path):
+    fifo = tmp_path / "pipe"
+    os.mkfifo(fifo)
+    data = os.urandom(200_003)
+
+    def write():
+        with open(fifo, "wb") as f:
+            for offset in range(0, len(data), 4099):
+                f.write(data[offset : offset + 4099])
+                f.flush()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        encoded = b"".join(fileio.iter_base64(str(fifo), 3 * 1024))
+    finally:
+        writer.join()
+    assert encoded == base64.b64encode(data)
+
+
+def test_encode_base64_range_concatenates(tmp_path):
+    data = _write(tmp_path / "f", 100_001)
+    chunk = 3 * 1000
+    pieces = [
+        fileio.encode_base64_range(str(tmp_path / "f"), offset, chunk)
+        for offset in range(0, len(data), chunk)
+    ]
+    assert b"".join(pieces) == base64.b64encode(data)
+
+
+@pytest.mark.parametrize("size", [0, 5, 5 * fileio.CHUNK_SIZE + 7])
+def test_sha256_file(tmp_path, size):
+    data = _write(tmp_path / "f", size)
+    assert fileio.sha256_file(str(tmp_path / "f")) == hashlib.sha256(data).hexdigest()
+
+
+def _encode_in_worker(path, destination, apikey):
+    import sys
+
+    body = fileio.encode_upload_body(path, destination, apikey)
+    return body, "agi_tools_client.cli" in sys.modules
+
+
+def test_encode_upload_body_is_json(tmp_path):
+    data = _write(tmp_path / "f", 10_007)
+    body = fileio.encode_upload_body(str(tmp_path / "f"), "/volume/f", "key")
+    assert json.loads(body) == {
+        "destination": "/volume/f",
+        "agint_apikey": "key",
+        "api_key": "key",
+        "source": base64.b64encode(data).decode("ascii"),
+    }
+
+
+def test_encode_upload_body_in_spawned_worker(tmp_path):
+    # Spawned workers import the module of the function they run; it must
+    # not pull in the CLI, which fetches the OpenAPI spec on import
+    data = _write(tmp_path / "f", 4099)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        body, imported_cli = pool.submit(
+            _encode_in_worker, str(tmp_path / "f"), "/volume/f", "key"
+        ).result(timeout=60)
+    assert not imported_cli
+    assert body == fileio.encode_upload_body(str(tmp_path / "f"), "/volume/f", "key")
+    assert json.loads(body)["source"] == base64.b64encode(data).decode("ascii")
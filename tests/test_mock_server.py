@@ -0,0 +1,37 @@
+import threading
+import time
+
+import pytest
+
+from agi_tools_client.mock_server import CHUNK_SIZE, MockServer
+
+
+def _throttled_seconds(server, threads=4, chunks=5):
+    def send():
+        for _ in range(chunks):
+            server.throttle(CHUNK_SIZE)
+
+    workers = [threading.Thread(target=send) for _ in range(threads)]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.monotonic() - started
+
+
+@pytest.mark.parametrize("per_connection", [False, True])
+def test_bandwidth_is_shared_unless_per_connection(tmp_path, per_connection):
+    server = MockServer(
+        tmp_path, bandwidth=100 * CHUNK_SIZE, per_connection=per_connection
+    )
+    try:
+        elapsed = _throttled_seconds(server)
+    finally:
+        server.close()
+    # 20 chunks at 100 chunks/s: 0.2s over one shared link (less the one
+    # chunk an idle link banks), 0.05s when each connection has its own
+    if per_connection:
+        assert elapsed < 0.15
+    else:
+        assert elapsed >= 0.18
@@ -0,0 +1,153 @@
+from typing import List
+
+from agi_tools_client.schema import SchemaResolver, python_type, schema_type
+
+
+def _operation(schema):
+    return {"requestBody": {"content": {"application/json": {"schema": schema}}}}
+
+
+def test_refs_are_followed_and_memoized():
+    spec = {
+        "components": {
+            "schemas": {
+                "Name": {"type": "string", "description": "A name"},
+                "Body": {
+                    "type": "object",
+                    "properties": {
+                        "first": {"$ref": "#/components/schemas/Name"},
+                        "second": {"$ref": "#/components/schemas/Name"},
+                    },
+                },
+            }
+        }
+    }
+    resolver = SchemaResolver(spec)
+    body = resolver.body_schema(_operation({"$ref": "#/components/schemas/Body"}))
+    assert body["properties"]["first"] == {"type": "string", "description": "A name"}
+    assert body["properties"]["first"] is body["properties"]["second"]
+
+
+def test_recursive_refs_are_cut_off():
+    spec = {
+        "components": {
+            "schemas": {
+                "Node": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "children": {
+                            "type": "array",
+                            "items": {"$ref": "#/components/schemas/Node"},
+                        },
+                        "parent": {"$ref": "#/components/schemas/Tree"},
+                    },
+                },
+                "Tree": {
+                    "type": "object",
+                    "properties": {"root": {"$ref": "#/components/schemas/Node"}},
+                },
+            }
+        }
+    }
+    node = SchemaResolver(spec).resolve_ref("#/components/schemas/Node")
+    assert node["properties"]["children"]["items"] == {
+        "type": "object",
+        "x-recursive-ref": "#/components/schemas/Node",
+    }
+    tree = node["properties"]["parent"]
+    assert tree["properties"]["root"]["x-recursive-ref"] == "#/components/schemas/Node"
+
+
+def test_all_of_parts_are_merged():
+    spec = {
+        "components": {
+            "schemas": {
+                "Base": {
+                    "type": "object",
+                    "properties": {
+                        "prompt": {"type": "string"},
+                        "verbose": {"type": "boolean", "description": "base"},
+                    },
+                    "required": ["prompt"],
+                }
+            }
+        }
+    }
+    schema = {
+        "allOf": [
+            {"$ref": "#/components/schemas/Base"},
+            {
+                "properties": {"output_dir": {"type": "string"}},
+                "required": ["output_dir", "prompt"],
+            },
+        ],
+        "properties": {"verbose": {"type": "boolean", "description": "own"}},
+    }
+    body = SchemaResolver(spec).resolve(schema)
+    assert set(body["properties"]) == {"prompt", "verbose", "output_dir"}
+    # Keys on the schema itself win over allOf parts
+    assert body["properties"]["verbose"]["description"] == "own"
+    assert body["required"] == ["prompt", "output_dir"]
+    assert body["type"] == "object"
+
+
+def test_ref_siblings_override_the_target():
+    spec = {"components": {"schemas": {"Name": {"type": "string", "description": "x"}}}}
+    resolved = SchemaResolver(spec).resolve(
+        {"$ref": "#/components/schemas/Name", "description": "y"}
+    )
+    assert resolved == {"type": "string", "description": "y"}
+
+
+def test_local_pointers_outside_components_resolve():
+    spec = {"x-shared": {"Flag": {"type": "boolean"}}}
+    assert SchemaResolver(spec).resolve({"$ref": "#/x-shared/Flag"}) == {
+        "type": "boolean"
+    }
+
+
+def test_nullable_unions():
+    assert schema_type({"anyOf": [{"type": "null"}, {"type": "integer"}]}) == "integer"
+    assert schema_type({"oneOf": [{"type": "number"}, {"type": "null"}]}) == "number"
+    assert schema_type({"type": ["null", "boolean"]}) == "boolean"
+    assert schema_type({"type": "null"}) == "string"
+    assert schema_type({}) == "string"
+
+
+def test_python_type_annotations():
+    assert python_type({"type": "integer"}) is int
+    assert python_type({"anyOf": [{"type": "boolean"}, {"type": "null"}]}) is bool
+    assert python_type({"type": "array", "items": {"type": "number"}}) == List[float]
+    assert (
+        python_type(
+            {
+                "anyOf": [
+                    {"type": "array", "items": {"type": "integer"}},
+                    {"type": "null"},
+                ]
+            }
+        )
+        == List[int]
+    )
+    assert python_type({"type": "array", "items": {"type": "object"}}) == List[str]
+    assert python_type({"anyOf": [{"type": "object"}, {"type": "null"}]}) is str
+
+
+def test_describe_parameters_is_cached_per_operation():
+    operation = _operation(
+        {
+            "type": "object",
+            "properties": {
+                "count": {"anyOf": [{"type": "integer"}, {"type": "null"}]},
+                "name": {"type": "string"},
+            },
+        }
+    )
+    resolver = SchemaResolver({})
+    descriptors = resolver.describe_parameters(operation)
+    assert [(d["name"], d["annotation"]) for d in descriptors] == [
+        ("count", int),
+        ("name", str),
+    ]
+    assert resolver.describe_parameters(operation) is descriptors
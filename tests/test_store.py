@@ -0,0 +1,103 @@
+import pytest
+
+from agi_tools_client import store as store_module
+from agi_tools_client.store import ObjectStore, volume_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    opened = ObjectStore(tmp_path / "store.db")
+    yield opened
+    opened.close()
+
+
+def test_has_upload_matches_volume_destination_and_digest(store):
+    store.record_uploads("vol", [("agitransfer://a.txt", "aaa", 1)])
+    assert store.has_upload("vol", "agitransfer://a.txt", "aaa")
+    assert not store.has_upload("vol", "agitransfer://a.txt", "bbb")
+    assert not store.has_upload("vol", "agitransfer://b.txt", "aaa")
+    assert not store.has_upload("other", "agitransfer://a.txt", "aaa")
+
+
+def test_record_replaces_the_previous_digest(store):
+    store.record_uploads("vol", [("agitransfer://a.txt", "aaa", 1)])
+    store.record_uploads("vol", [("agitransfer://a.txt", "bbb", 2)])
+    assert store.has_upload("vol", "agitransfer://a.txt", "bbb")
+    assert not store.has_upload("vol", "agitransfer://a.txt", "aaa")
+
+
+def test_records_persist_across_connections(tmp_path, store):
+    store.record_uploads("vol", [("agitransfer://a.txt", "aaa", 1)])
+    reopened = ObjectStore(tmp_path / "store.db")
+    try:
+        assert reopened.has_upload("vol", "agitransfer://a.txt", "aaa")
+    finally:
+        reopened.close()
+
+
+def test_forget_drops_prefixes_on_one_volume(store):
+    records = [
+        ("agitransfer://out/a", "1", 1),
+        ("agitransfer://out/sub/b", "2", 1),
+        ("agitransfer://outputs/c", "3", 1),
+        ("agitransfer://d", "4", 1),
+    ]
+    store.record_uploads("vol", records)
+    store.record_uploads("other", records)
+
+    store.forget("vol", ["agitransfer://out/"])
+    assert not store.has_upload("vol", "agitransfer://out/a", "1")
+    assert not store.has_upload("vol", "agitransfer://out/sub/b", "2")
+    assert store.has_upload("vol", "agitransfer://outputs/c", "3")
+    assert store.has_upload("vol", "agitransfer://d", "4")
+    assert store.has_upload("other", "agitransfer://out/a", "1")
+
+    store.forget("vol", ["agitransfer://"])
+    assert not store.has_upload("vol", "agitransfer://d", "4")
+    assert store.has_upload("other", "agitransfer://d", "4")
+
+
+def test_collect_garbage_evicts_least_recently_used(tmp_path, monkeypatch):
+    store = ObjectStore(tmp_path / "store.db", max_entries=3)
+    try:
+        for second in range(5):
+            monkeypatch.setattr(store_module.time, "time", lambda: 1000.0 + second)
+            store.record_uploads("vol", [(f"agitransfer://{second}", str(second), 1)])
+        # Re-recording refreshes an entry's LRU position
+        monkeypatch.setattr(store_module.time, "time", lambda: 2000.0)
+        store.record_uploads("vol", [("agitransfer://0", "0", 1)])
+
+        assert store.collect_garbage() == 2
+        assert store.collect_garbage() == 0
+        kept = [
+            second
+            for second in range(5)
+            if store.has_upload("vol", f"agitransfer://{second}", str(second))
+        ]
+        assert kept == [0, 3, 4]
+    finally:
+        store.close()
+
+
+def test_open_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("AGI_STORE_DIR", str(tmp_path / "dir"))
+    monkeypatch.setenv("AGI_STORE_MAX_ENTRIES", "7")
+    opened = ObjectStore.open_default()
+    try:
+        assert opened.path == tmp_path / "dir" / "store.db"
+        assert opened.max_entries == 7
+    finally:
+        opened.close()
+
+    monkeypatch.setenv("AGI_STORE_MAX_ENTRIES", "many")
+    assert ObjectStore.open_default() is None
+    monkeypatch.setenv("AGI_STORE", "0")
+    assert ObjectStore.open_default() is None
+
+
+def test_volume_key_hides_the_api_key():
+    key = volume_key("http://a", "secret-key")
+    assert "secret" not in key
+    assert key == volume_key("http://a", "secret-key")
+    assert key != volume_key("http://b", "secret-key")
+    assert key != volume_key("http://a", "other-key")
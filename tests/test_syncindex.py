@@ -0,0 +1,115 @@
+import os
+import stat
+
+import pytest
+
+from agi_tools_client.syncindex import MAGIC, SyncIndex
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = SyncIndex()
+    index.mark("b.txt", 2.5, 20)
+    index.mark("a/ü.txt", 1.0, 10)
+    index.mark("z", 3.0, 0)
+    index.save(tmp_path / "index")
+
+    loaded = SyncIndex.load(tmp_path / "index")
+    assert len(loaded) == 3
+    assert loaded.is_current("a/ü.txt", 1.0, 10)
+    assert loaded.is_current("b.txt", 2.5, 20)
+    assert loaded.is_current("z", 3.0, 0)
+    assert not loaded.is_current("b.txt", 2.5, 21)
+    assert not loaded.is_current("missing", 1.0, 10)
+
+
+def test_empty_index_round_trip(tmp_path):
+    SyncIndex().save(tmp_path / "index")
+    loaded = SyncIndex.load(tmp_path / "index")
+    assert len(loaded) == 0
+    assert not loaded.is_current("", 0.0, 0)
+
+
+def test_undecodable_path_round_trip(tmp_path):
+    path = b"bad-\xff.bin".decode("utf-8", "surrogateescape")
+    index = SyncIndex()
+    index.mark(path, 1.0, 1)
+    index.save(tmp_path / "index")
+    assert SyncIndex.load(tmp_path / "index").is_current(path, 1.0, 1)
+
+
+def test_contains_reports_entries_marked_since_load(tmp_path):
+    index = SyncIndex.from_mapping(
+        {"kept": {"mtime": 1.0, "size": 1}, "stale": {"mtime": 2.0, "size": 2}}
+    )
+    index.mark("kept", 1.0, 1)
+    index.mark("new", 3.0, 3)
+    assert "kept" in index
+    assert "new" in index
+    assert "stale" not in index
+    assert 42 not in index
+
+
+def test_compact_drops_unmarked_entries(tmp_path):
+    index = SyncIndex.from_mapping(
+        {
+            "deleted": {"mtime": 1.0, "size": 1},
+            "kept": {"mtime": 2.0, "size": 2},
+            "updated": {"mtime": 3.0, "size": 3},
+        }
+    )
+    index.mark("kept", 2.0, 2)
+    index.mark("updated", 4.0, 4)
+    index.mark("added", 5.0, 5)
+    index.compact()
+    index.save(tmp_path / "index")
+
+    loaded = SyncIndex.load(tmp_path / "index")
+    assert len(loaded) == 3
+    assert not loaded.is_current("deleted", 1.0, 1)
+    assert loaded.is_current("kept", 2.0, 2)
+    assert loaded.is_current("updated", 4.0, 4)
+    assert loaded.is_current("added", 5.0, 5)
+
+
+def test_from_mapping_migrates_legacy_cache():
+    index = SyncIndex.from_mapping(
+        {
+            "b.txt": {"mtime": 2, "size": "20"},
+            "a.txt": {"mtime": 1.5, "size": 10},
+            "no-size": {"mtime": 1.0},
+            "not-a-dict": "x",
+            "bad-number": {"mtime": "soon", "size": 1},
+        }
+    )
+    assert len(index) == 2
+    assert index.is_current("a.txt", 1.5, 10)
+    assert index.is_current("b.txt", 2.0, 20)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"", b"AGISYNC", b"NOTSYNC1" + bytes(16), MAGIC + (1).to_bytes(8, "little")],
+)
+def test_load_rejects_corrupt_files(tmp_path, data):
+    (tmp_path / "index").write_bytes(data)
+    with pytest.raises(ValueError):
+        SyncIndex.load(tmp_path / "index")
+
+
+def test_load_rejects_truncated_file(tmp_path):
+    index = SyncIndex()
+    index.mark("a.txt", 1.0, 10)
+    index.save(tmp_path / "index")
+    data = (tmp_path / "index").read_bytes()
+    (tmp_path / "index").write_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        SyncIndex.load(tmp_path / "index")
+
+
+def test_save_keeps_existing_file_mode(tmp_path):
+    target = tmp_path / "index"
+    SyncIndex().save(target)
+    os.chmod(target, 0o664)
+    SyncIndex().save(target)
+    assert stat.S_IMODE(os.stat(target).st_mode) == 0o664
+    assert [p.name for p in tmp_path.iterdir()] == ["index"]